@@ -0,0 +1,65 @@
+r"""
+Benchmark of evaluating many checkers in worker processes over the shared
+memory history (see tools.general.parallel).
+
+Every checker takes a Savitzky-Golay derivative over a long window of one of
+the tags. The same set of checkers is evaluated in the main process and in
+pools of increasing size, and the throughput and the speed-up are printed.
+
+Usage:
+    python -m benchmarks.parallel [--tags 1000] [--checkers 20000] [--window 1024] [--repeat 5]
+"""
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from tools.general import parallel
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tags", type=int, default=1000)
+    parser.add_argument("--checkers", type=int, default=20000)
+    parser.add_argument("--window", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="*", default=None,
+                        help="pool sizes, defaults to powers of two up to the number of cores")
+    args = parser.parse_args(argv)
+
+    tags = [f"TI-{i:05d}" for i in range(args.tags)]
+    history = parallel.SharedHistory(tags, capacity=args.window)
+    rng = np.random.default_rng(0)
+    for _ in range(args.window):
+        history.append(rng.normal(50, 1, args.tags))
+    specs = [(i % args.tags, "savgol", 1, args.window, -0.1, 0.1) for i in range(args.checkers)]
+
+    # in the main process, as the checkers would be evaluated without workers
+    parallel._history_ = history
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        parallel._evaluate_(specs)
+    baseline = (time.perf_counter() - start) / args.repeat
+    print(f"{'workers':>8} {'s/tick':>10} {'checkers/s':>12} {'speed-up':>9}")
+    print(f"{'main':>8} {baseline:10.4f} {args.checkers / baseline:12.0f} {1:9.2f}")
+
+    cores = multiprocessing.cpu_count()
+    workers = args.workers or [2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores]
+    try:
+        for iWorkers in workers:
+            evaluator = parallel.ParallelEvaluator(history, iWorkers)
+            evaluator.evaluate(specs)  # warm up the workers (imports, coefficients)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                evaluator.evaluate(specs)
+            duration = (time.perf_counter() - start) / args.repeat
+            evaluator.close()
+            print(f"{iWorkers:>8} {duration:10.4f} {args.checkers / duration:12.0f} {baseline / duration:9.2f}")
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
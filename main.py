@@ -1,7 +1,14 @@
+import json
+import os
 import sys
 
-from PyQt5.QtCore import (QState, QTimer)
-from PyQt5.QtWidgets import (QApplication)
+# Without a display (or Qt) the package can run on the asyncio runtime instead.
+# The backend has to be chosen before anything of the package is imported.
+if "--headless" in sys.argv:
+    os.environ["CCO_BACKEND"] = "asyncio"
+
+from tools.general.backend import (QTimer)
+from tools.general.backend import (QApplication)
 
 import logging.handlers
 logger = logging.getLogger()
@@ -9,6 +16,8 @@ logger.setLevel(logging.DEBUG)
 
 from tools.tcs import mashina
 from tools import tcs_statemashina
+from tools.general import trace
+from tools.general.acquisition import Acquisition
 
 ch = logging.StreamHandler()
 ch.setLevel(logging.INFO)
@@ -24,62 +33,47 @@ logger.addHandler(fh)
 
 logging.info('Started')
 
+# edits of both can be checked offline with python -m tools.validate
 configPath = r"config.json"
+topologyPath = r"topology.json"
+# the tags, capacity and workers of the evaluator, only read with --evaluator
+evaluatorPath = r"evaluator.json"
 
 if __name__ == "__main__":
+    if "--trace" in sys.argv:
+        # written on error and at exit, open in chrome://tracing or ui.perfetto.dev
+        trace.enable(errorPath="cco_trace.json")
+
     app = QApplication(sys.argv)
 
-    tcs = mashina.TCSMashina()
+    acquisition = Acquisition()
+    tcs = mashina.TCSMashina(acquisition)
     TCSstate = tcs_statemashina.statemashina.TCSStateMashina(tcs, configPath, 1000)
-    startingpoint = tcs_statemashina.other.StartingPoint()
-    TCSstate.addState(startingpoint)
-
-    neutral = tcs_statemashina.neutral.Neutral()
-    TCSstate.addState(neutral)
-
-    startingpoint.addTransition(tcs.ready, neutral)
-
-    charging = QState(QState.ParallelStates)
-    TCSstate.addState(charging)
-
-    neutral.addTransition(tcs.charge, charging)
-
-    charging_ad = tcs_statemashina.charging.ad.Main(charging)
-
-    charging_ad_phase_1A = tcs_statemashina.charging.ad.Phase_1A(charging_ad)
-    charging_ad.setInitialState(charging_ad_phase_1A)
-
-    charging_ad_phase_1B = tcs_statemashina.charging.ad.Phase_1B(charging_ad)
-    charging_ad_phase_1A.addTransition(tcs.stableADTemp,
-                                       charging_ad_phase_1B)
-
-    charging_ad_phase_2 = tcs_statemashina.charging.ad.Phase_2(charging_ad)
-    charging_ad_phase_1B.addTransition(charging_ad_phase_1B.warmup,
-                                       charging_ad_phase_2)
-
-    charging_ad_phase_3 = tcs_statemashina.charging.ad.Phase_3(charging_ad)
-    charging_ad_phase_3A = tcs_statemashina.charging.ad.Phase_3A(charging_ad_phase_3)
-    charging_ad_phase_3B = tcs_statemashina.charging.ad.Phase_3B(charging_ad_phase_3)
-    charging_ad_phase_3.setInitialState(charging_ad_phase_3A)
-
-    charging_ad_phase_3A.addTransition(tcs.temperatureReached, charging_ad_phase_3B)
-    charging_ad_phase_3B.addTransition(tcs.powerReached, neutral)
-
-    charging_ad_phase_2.addTransition(tcs.temperatureReached,
-                                      charging_ad_phase_3)
-
-    charging_ec = tcs_statemashina.charging.ec.Main(charging)
-
-    charging_ec_phase_1A = tcs_statemashina.charging.ec.Phase_1A(charging_ec)
-    charging_ec.setInitialState(charging_ec_phase_1A)
-
-    charging.addTransition(tcs.error, neutral)
-
-    TCSstate.setInitialState(startingpoint)
+    # The states and transitions are described in the topology file
+    tcs_statemashina.topology.build(TCSstate, tcs_statemashina.topology.load(topologyPath, TCSstate.constants,
+                                                                             tcs_statemashina.topology.signalNames(tcs)))
+    if "--evaluator" in sys.argv:
+        # the checkers of tags are evaluated in worker processes, see tools.general.parallel
+        from tools.general import parallel
+        with open(evaluatorPath, mode="r") as file:
+            evaluator = parallel.fromSettings(json.load(file))
+        tcs.checkers.setEvaluator(evaluator)
+    acquisition.start()
     TCSstate.start()
 
+    if "--serve" in sys.argv:
+        # dashboards read from here instead of polling the cRIO themselves
+        from tools.general.snapshot import SnapshotServer
+        snapshotServer = SnapshotServer(acquisition, port=8100)
+        snapshotServer.addUnit("TCS", tcs.checkers, TCSstate)
+        snapshotServer.start()
+
     timer = QTimer()
     timer.timeout.connect(TCSstate.stop_timers)
+    timer.timeout.connect(acquisition.stop)
+    if "--evaluator" in sys.argv:
+        timer.timeout.connect(evaluator.close)
+        timer.timeout.connect(evaluator.history.close)
     timer.timeout.connect(app.quit)
     timer.start(100000)
 
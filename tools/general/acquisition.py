@@ -0,0 +1,179 @@
+import inspect
+import json
+import urllib.request
+
+from tools.general.backend import BACKEND, QObject, pyqtSignal, QTimer, clock
+from tools.general.history import HistoryStore
+from tools.general import trace
+
+import logging
+
+DATABASE = r"C:/Users/mohanam/Desktop/ToDO/CCO_Demo/cRIOTagSimDB.xlsx"
+
+
+def readDatabase(path=DATABASE):
+    r"""Reads the latest data of all tags.
+
+    Parameters
+    ----------
+    path \: str
+
+    Returns
+    -------
+    pandas.DataFrame
+        index being the time, columns the tags
+    """
+    import pandas as pd
+    return pd.read_excel(path, index_col=0)
+
+
+def webService(url="http://localhost:8002/cRIO-Webservice/", timeout=5):
+    r"""Returns a source reading the current data from a cRIO web service.
+
+    Works with the cRIO as well as with its simulator (tools.simulator.crio).
+    The data is keyed by attribute (e.g. "TICA-101.PV"), the process values
+    are also available under the bare tag (e.g. "TICA-101") like in the
+    database.
+
+    Parameters
+    ----------
+    url \: str
+        the base URL of the web service
+    timeout \: int or float
+        seconds
+
+    Returns
+    -------
+    function
+        see Acquisition
+    """
+    def read():
+        with urllib.request.urlopen(url + "getCurrentData", timeout=timeout) as response:
+            return _frame_(json.loads(response.read())["Data"])
+    return read
+
+
+def controlSystem(system):
+    r"""Returns a source reading the current data of a ControlSystemMap.
+
+    The source is a coroutine function, the request is sent in an executor
+    so that the event loop is not blocked while waiting for the cRIO. It
+    therefore needs the asyncio backend (see tools.general.backend).
+
+    Parameters
+    ----------
+    system \: ControlSystemMap
+        see tools.general.controlsystem
+
+    Returns
+    -------
+    coroutine function
+        see Acquisition
+    """
+    async def read():
+        return _frame_(dict(await system.getCurrentDataAsync()))
+    return read
+
+
+def _frame_(data):
+    r"""Returns the data keyed by attribute as a frame, the process values also by the bare tag."""
+    import pandas as pd
+    data.update({iAttribute[:-len(".PV")]: iValue for iAttribute, iValue in list(data.items())
+                 if iAttribute.endswith(".PV")})
+    return pd.DataFrame([data], index=[clock()])
+
+
+class Acquisition(QObject):
+    r"""
+
+        Polls the data of all tags once per interval and shares it between all
+        checkers (and mashinas) of a process, so that adding checkers or units
+        only adds their evaluation and not more requests for data.
+
+        The newest sample of every tag is also added to the history store,
+        which the checkers with a horizon read. The data and the history are
+        stamped with the clock of the backend (see backend.clock), so they
+        follow the virtual time of the VirtualScheduler.
+
+        Parameters
+        ----------
+        source \: function
+            returns the latest data as pandas.DataFrame, by default
+            readDatabase. A coroutine function is awaited, which needs the
+            asyncio backend; a poll is skipped while the previous one is
+            still waiting.
+        interval \: int or float
+            the miliseconds between each poll
+        history \: HistoryStore
+    """
+
+    updated = pyqtSignal()
+
+    def __init__(self, source=None, interval=1000, history=None):
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.logger.info("Creating acquisition")
+        self.source = source or readDatabase
+        self._async_ = inspect.iscoroutinefunction(self.source)
+        if self._async_ and BACKEND != "asyncio":
+            raise ValueError("A coroutine source needs the asyncio backend (CCO_BACKEND=asyncio).")
+        self._pending_ = None
+        self.history = history if history is not None else HistoryStore()
+        self.data = None
+        self.dataTime = None
+        self._timer_ = QTimer()
+        self._timer_.setInterval(interval)
+        self._timer_.timeout.connect(self.poll)
+
+    def start(self):
+        self.logger.info("Starting acquisition.")
+        self.poll()
+        self._timer_.start()
+
+    def stop(self):
+        self.logger.info("Acquisition stopped.")
+        self._timer_.stop()
+        if self._pending_ is not None:
+            self._pending_.cancel()
+
+    def poll(self):
+        if self._async_:
+            if self._pending_ is None or self._pending_.done():
+                from tools.general import runtime
+                self._pending_ = runtime.loop().create_task(self._pollAsync_())
+            else:
+                self.logger.debug("Previous poll still waiting, skipping.")
+            return
+        if trace.active:
+            trace.begin("poll", "acquisition")
+        try:
+            self.logger.debug("Getting latest data.")
+            data = self.source()
+        except Exception as E:
+            self.logger.error(f"Latest data not obtained!: {E}")
+            return
+        finally:
+            if trace.active:
+                trace.end("poll", "acquisition")
+        self._update_(data)
+
+    async def _pollAsync_(self):
+        if trace.active:
+            trace.begin("poll", "acquisition")
+        try:
+            self.logger.debug("Getting latest data.")
+            data = await self.source()
+        except Exception as E:
+            self.logger.error(f"Latest data not obtained!: {E}")
+            return
+        finally:
+            if trace.active:
+                trace.end("poll", "acquisition")
+        self._update_(data)
+
+    def _update_(self, data):
+        self.data = data
+        self.dataTime = clock()
+        if len(data):
+            self.history.append(self.dataTime, data.iloc[-1])
+        self.updated.emit()
@@ -0,0 +1,36 @@
+r"""
+Selects the event loop backend of the package.
+
+By default PyQt5 is used. Setting the environment variable CCO_BACKEND to
+"asyncio" (before the package is imported) runs everything on the headless
+asyncio runtime of tools.general.runtime instead, without importing Qt.
+
+The rest of the package imports the Qt names from here, e.g.:
+    from tools.general.backend import QObject, pyqtSignal, QTimer
+
+clock() returns the seconds of the clock the timers run on, which is virtual
+on the VirtualScheduler of the runtime.
+"""
+
+import os
+
+BACKEND = os.environ.get("CCO_BACKEND", "qt").lower()
+
+if BACKEND == "qt":
+    from PyQt5.QtCore import (QObject, QState, QStateMachine, QTimer, pyqtSignal, pyqtSlot)
+    from PyQt5.QtWidgets import QApplication
+    from time import monotonic as clock
+elif BACKEND == "asyncio":
+    from tools.general.runtime import (Object as QObject,
+                                       State as QState,
+                                       StateMachine as QStateMachine,
+                                       Timer as QTimer,
+                                       Signal as pyqtSignal,
+                                       slot as pyqtSlot,
+                                       Application as QApplication)
+    from tools.general import runtime
+
+    def clock():
+        return runtime.scheduler().time()
+else:
+    raise ImportError(f"Unknown backend {BACKEND}. Set CCO_BACKEND to qt or asyncio.")
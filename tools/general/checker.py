@@ -1,12 +1,14 @@
-import pandas as pd
-
-from copy import deepcopy
-
-import findiff
 from collections import deque
-import numpy as np
+from functools import partial
 
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer
+from tools.general.backend import QObject, pyqtSignal, QTimer, clock
+
+from tools.general.limitindex import LimitIndex
+from tools.general import filters
+from tools.general import settings as checkerSettings
+from tools.general import conditions
+from tools.general.acquisition import readDatabase
+from tools.general import trace
 
 import logging
 # logger = logging.getLogger(__name__)
@@ -52,24 +54,57 @@ class GeneralChecker(QObject):
                 acc \: int
                     the distance from the center point of the window (should be even). Simply can be regarded as the
                     window size.
+                filter \: str
+                    the filter used for smoothing or the derivative: "mean", "backward", "savgol", "ema" or
+                    "median" (see tools.general.filters). Defaults to "backward" for derivatives and "mean"
+                    otherwise.
                 interval \: int or float
                     the miliseconds between each check
+                horizon \: int or float
+                    seconds. When given, the checked value is the aggregate of the tag over this horizon, taken
+                    from the multi-resolution history of the acquisition (see tools.general.history) instead of
+                    averaged over the last window checks. The history includes the samples from before the checker
+                    was created. der, acc, window and filter are not applied, the der aggregate gives the trend.
+                    Meant for long horizons like the mean flow over the last 30 minutes. Needs the tag setting and
+                    an acquisition.
+                aggregate \: str
+                    the aggregate over the horizon: "mean", "min", "max" or "der"
+                adaptive \: bool
+                    if True, the interval is adapted after every check to the projected time until the checked
+                    value crosses one of the limits (based on its current trend), between mininterval and
+                    maxinterval. Checkers far from their limits are then checked less often and checkers close to
+                    them more often. Within margin of a limit the checker is checked at least at the fixed
+                    interval, whatever its trend.
+                mininterval \: int or float
+                    the shortest interval in miliseconds when adaptive
+                maxinterval \: int or float
+                    the longest interval in miliseconds when adaptive
+                margin \: int or float
+                    the distance to a limit (in the unit of the checked value) below which an adaptive checker is
+                    checked at the fixed interval. Further away the interval may grow with the distance. Defaults to
+                    5 % of the limit.
+                critical \: bool
+                    safety-critical checkers are always checked at the fixed interval, even when adaptive
+                tag \: str
+                    the tag checked when func is None (and only then). Only checkers of a tag can be
+                    evaluated in worker processes (see CheckerMaster.setEvaluator).
+        name \: str
+        acquisition \: Acquisition
+            shares its data instead of every checker reading the data itself
     """
 
     outLimit = pyqtSignal()
     inLimit = pyqtSignal()
 
-    defaultParameters = {"lowlimit": -float('inf'),
-                         "highlimit": float('inf'),
-                         "der": 0,
-                         "acc": 0,
-                         "window": 1,
-                         "interval": 1000
-                         }
+    defaultParameters = checkerSettings.DEFAULTS
+
+    # fraction of the projected time until a limit is crossed used as next interval
+    adaptiveSafety = 0.5
 
-    def __init__(self, func, settings, name=""):
+    def __init__(self, func, settings, name="", acquisition=None):
         super().__init__()
         self._func_ = func
+        self.acquisition = acquisition
         self.logger = logging.getLogger(__name__)
         self.logger.info("Creating checker")
         self.logger.debug(f"Creating checker with the following settings {settings}.")
@@ -77,8 +112,21 @@ class GeneralChecker(QObject):
         self.setObjectName(name)
         self._timer_ = None
         self._update_parameters()
+        if (self._func_ is None) == (self.par["tag"] is None):
+            raise ValueError(f"Checker {name} needs exactly one of func and the tag setting.")
+        # only checkers of a tag can be evaluated from the shared history
+        self.byTag = self._func_ is None
+        if self.byTag:
+            tag = self.par["tag"]
+            self._func_ = lambda x: x[tag]
+        if self.par["horizon"] and (not self.byTag or acquisition is None):
+            # the history of a derived value would only start with the checker, i.e. with the phase
+            raise ValueError(f"Checker {name} needs the tag setting and an acquisition for a horizon.")
         self._setup_der_coef()
-        self._finalylist_ = deque(self.par["window"] * [np.NAN])
+        self._finalylist_ = deque(self.par["window"] * [float('nan')])
+        self._lastCheck_ = None
+        # no data until the first reading of the database or the acquisition
+        self.data = None
         self._setup_timer()
         self._getData_()
 
@@ -96,13 +144,12 @@ class GeneralChecker(QObject):
                 self._timer_.setInterval(self.par["interval"])
 
     def _setup_der_coef(self):
-        self._derwindow_ = self.par["acc"] + 1
-        if self.par["der"] > 0:
-            self._dercoef_ = findiff.coefficients(deriv=self.par["der"],
-                                                  acc=self.par["acc"])["backward"]["coefficients"]
-        else:
-            self._dercoef_ = np.array(self._derwindow_ * [1 / self._derwindow_])
-        self._ylist_ = deque(self._derwindow_ * [np.NAN])
+        self._filter_ = self.par["filter"] or filters.default(self.par["der"])
+        self._derwindow_ = filters.window(self._filter_, self.par["der"], self.par["acc"])
+        if self._filter_ != "median":
+            # validates the settings and fills the process-wide cache
+            filters.coefficients(self._filter_, self.par["der"], self._derwindow_)
+        self._ylist_ = deque(self._derwindow_ * [float('nan')], maxlen=self._derwindow_)
 
     def _setup_timer(self):
         self.logger.info("Initializing the checker timer.")
@@ -113,7 +160,7 @@ class GeneralChecker(QObject):
         self._timer_.start()
 
     def _derfunc_(self, y):
-        r"""Calculates the derivative of values returned from func.
+        r"""Calculates the derivative (or smoothed value) of values returned from func.
 
         It fills up a y-list (initialized with NaN) with new data. This is
         done in case there is not enough data available. This should be changed
@@ -129,20 +176,24 @@ class GeneralChecker(QObject):
         float
             the derivative of the data
         """
-        for i in y:
-            self._ylist_.popleft()
-            self._ylist_.append(i)
-        return np.nansum(self._dercoef_ * np.array(self._ylist_))
+        self._ylist_.extend(y)
+        return filters.apply(self._filter_, self.par["der"], self._derwindow_, self._ylist_)
 
     def _getData_(self):
         r"""Get the latest data in the MySQL database.
 
         Saves the latest data from the MySQL database into memory of the
-        checker object.
+        checker object. When the checker has an acquisition, its latest data
+        is used instead.
         """
+        if self.acquisition is not None:
+            # shared with the other checkers, polled by the acquisition
+            if self.acquisition.data is not None:
+                self.data = self.acquisition.data
+            return
         try:
             self.logger.debug("Getting latest data.")
-            self.data = pd.read_excel(r"C:/Users/mohanam/Desktop/ToDO/CCO_Demo/cRIOTagSimDB.xlsx", index_col=0)
+            self.data = readDatabase()
         except:
             pass
 
@@ -159,6 +210,12 @@ class GeneralChecker(QObject):
     
     @property
     def checkValue(self):
+        if self.par["horizon"]:
+            history = self.acquisition.history
+            if self.par["tag"] not in history:
+                return float('nan')
+            return history.query(self.par["tag"], self.par["aggregate"], self.par["horizon"], now=clock())
+        import numpy as np
         return np.nanmean(self._finalylist_)
     
     def _run_(self):
@@ -169,62 +226,450 @@ class GeneralChecker(QObject):
         newY = self._func_(self.data).iloc[-self._derwindow_:].to_list()
         # conduct the derivation
         newderY = self._derfunc_(newY)
+        self._store_(newderY)
+
+    def _store_(self, newderY):
         # add to a confined list
         self._finalylist_.popleft()
         self._finalylist_.append(newderY)
 
     def run(self):
-        self.logger.info("Running check.")
-        self._run_()
-        self.logger.debug(f"Latest data: {self.data}.")
+        if trace.active:
+            trace.begin(self.objectName(), "checker")
+        try:
+            self.logger.info("Running check.")
+            if self.data is None:
+                self._getData_()
+            if self.data is None:
+                # the acquisition has not read any data yet
+                self.logger.debug("No data yet, skipping the check.")
+                return
+            self._run_()
+            if self.logger.isEnabledFor(logging.DEBUG):
+                # formatting the data frame costs more than the check itself
+                self.logger.debug(f"Latest data: {self.data}.")
+            self._emit_()
+        finally:
+            if trace.active:
+                trace.end(self.objectName(), "checker")
+
+    def spec(self, history):
+        r"""Describes the check of a tag for evaluation in a worker process.
 
+        Parameters
+        ----------
+        history \: SharedHistory
+            see tools.general.parallel
+
+        Returns
+        -------
+        tuple
+            (column, filter kind, order, window, lowlimit, highlimit)
+        """
+        return (history.column(self.par["tag"]), self._filter_, self.par["der"], self._derwindow_,
+                self.par["lowlimit"], self.par["highlimit"])
+
+    def report(self, value):
+        r"""Takes a value calculated elsewhere (e.g. in a worker process) as the
+        result of a check.
+
+        Parameters
+        ----------
+        value \: float
+            the filtered value
+        """
+        self._store_(value)
+        self._emit_()
+
+    def pause(self):
+        r"""Stops the timer, the checks are then done by calling report."""
+        self._timer_.stop()
+
+    def _emit_(self):
+        if trace.active:
+            trace.instant(self.objectName(), "result", {"value": float(self.checkValue),
+                                                        "status": bool(self._check_())})
         if self._check_():
             self.logger.info("The checked value is within the limits.")
             self.inLimit.emit()
         else:
             self.logger.info("The checked value is out of the limit.")
             self.outLimit.emit()
+        self._adapt_()
+
+    def _limits_(self):
+        return self.par["lowlimit"], self.par["highlimit"]
+
+    def _nextInterval_(self, value, rate):
+        r"""Projects the time until the value crosses one of the limits.
+
+        Only the limits in the direction of the trend are considered, so a
+        value moving towards a limit it still has to reach is handled the same
+        as one about to leave its limits. Independent of the trend, the
+        interval is limited by the distance to every limit: within margin of a
+        limit it is at most the fixed interval and further away it grows
+        linearly with the distance.
+
+        Parameters
+        ----------
+        value \: float
+            the latest checked value
+        rate \: float
+            the change of the checked value per second
+
+        Returns
+        -------
+        float
+            the next interval in miliseconds
+        """
+        if value != value or rate != rate:
+            return self.par["interval"]
+        crossing = float('inf')
+        interval = float('inf')
+        for iLimit in self._limits_():
+            if abs(iLimit) == float('inf'):
+                continue
+            margin = self.par["margin"] if self.par["margin"] is not None else 0.05 * abs(iLimit) or 1.
+            interval = min(interval, self.par["interval"] * max(1., abs(iLimit - value) / margin))
+            if rate == 0:
+                continue
+            t = (iLimit - value) / rate
+            if t >= 0:
+                crossing = min(crossing, t)
+        interval = min(interval, GeneralChecker.adaptiveSafety * crossing * 1000)
+        return min(max(interval, self.par["mininterval"]), self.par["maxinterval"])
+
+    def _adapt_(self):
+        if not self.par["adaptive"] or self.par["critical"]:
+            return
+        # the clock of the timers, i.e. virtual on the VirtualScheduler
+        now, value = clock(), self.checkValue
+        if self._lastCheck_ is not None and now > self._lastCheck_[0]:
+            rate = (value - self._lastCheck_[1]) / (now - self._lastCheck_[0])
+            interval = int(self._nextInterval_(value, rate))
+            if interval != self._timer_.interval():
+                self.logger.debug(f"Adapting interval to {interval} ms.")
+                self._timer_.setInterval(interval)
+        self._lastCheck_ = (now, value)
 
     def stop(self):
         self.logger.info("Checker stopped.")
         self._timer_.stop()
 
 
+class Band(QObject):
+    r"""
+
+        One pair of limits checked by a LimitChecker. It behaves like a
+        GeneralChecker towards the CheckerMaster and the mashinas (it has a name,
+        inLimit/outLimit signals and can be stopped), but it does no data
+        processing of its own.
+
+        Parameters
+        ----------
+        checker \: LimitChecker
+            the checker calculating the derived signal
+        name \: str
+    """
+
+    outLimit = pyqtSignal()
+    inLimit = pyqtSignal()
+
+    def __init__(self, checker, name):
+        super().__init__()
+        self.checker = checker
+        self.setObjectName(name)
+
+    @property
+    def checkValue(self):
+        return self.checker.checkValue
+
+    def stop(self):
+        self.checker.removeBand(self.objectName())
+
+
+class LimitChecker(GeneralChecker):
+    r"""
+
+        A checker calculating a derived signal once and checking it against
+        many limits (e.g. alarm levels L, LL, H and HH) kept in a LimitIndex.
+
+        Instead of emitting inLimit/outLimit itself, every new value is
+        resolved to the bands it lays within with a binary search and only the
+        bands whose status changed are notified. The checker stops itself once
+        its last band is removed.
+
+        Example of usage:
+            checker = LimitChecker(func=lambda x: x["TICA-101"], settings={}, name="TICA-101")
+            checker.addBand("Charge", {"lowlimit": 50}).inLimit.connect(charge)
+            checker.addBand("Discharge", {"highlimit": 20}).inLimit.connect(discharge)
+
+        Parameters
+        ----------
+        func \: function
+            see GeneralChecker
+        settings \: dict
+            see GeneralChecker, lowlimit and highlimit are ignored
+        name \: str
+            the name of the derived signal
+        acquisition \: Acquisition
+            see GeneralChecker
+    """
+
+    def __init__(self, func, settings, name="", acquisition=None):
+        super().__init__(func, settings, name, acquisition)
+        self.index = LimitIndex(name)
+        self._bands_ = {}
+
+    @staticmethod
+    def processing(settings):
+        r"""Returns the settings of a band other than its limits."""
+        return {k: settings.get(k, v) for k, v in GeneralChecker.defaultParameters.items()
+                if k not in ("lowlimit", "highlimit")}
+
+    def addBand(self, name, settings):
+        self.logger.info(f"Adding band {name} to {self.objectName()}.")
+        lowlimit = settings.get("lowlimit", GeneralChecker.defaultParameters["lowlimit"])
+        highlimit = settings.get("highlimit", GeneralChecker.defaultParameters["highlimit"])
+        self._bands_[name] = Band(self, name)
+        self.index.addBand(name, lowlimit, highlimit)
+        return self._bands_[name]
+
+    def removeBand(self, name):
+        self.logger.info(f"Removing band {name} from {self.objectName()}.")
+        self.index.removeBand(name)
+        self._bands_.pop(name)
+        if not self._bands_:
+            self.stop()
+
+    def _emit_(self):
+        entered, left = self.index.update(self.checkValue)
+        if trace.active:
+            trace.instant(self.objectName(), "result", {"value": float(self.checkValue),
+                                                        "entered": sorted(entered), "left": sorted(left)})
+        # a band can be removed by a slot connected to an earlier band
+        for iName in entered:
+            if iName in self._bands_:
+                self.logger.info(f"The checked value is within the limits of {iName}.")
+                self._bands_[iName].inLimit.emit()
+        for iName in left:
+            if iName in self._bands_:
+                self.logger.info(f"The checked value is out of the limit of {iName}.")
+                self._bands_[iName].outLimit.emit()
+        self._adapt_()
+
+    def _limits_(self):
+        return self.index.limits
+
+
 class CheckerMaster(object):
+    r"""
+
+        Holds the active checkers of a mashina, their latest status and the
+        composite conditions over them.
+
+        The status of a checker follows its inLimit/outLimit signals. Conditions
+        (see tools.general.conditions) are declared once with addCondition and
+        are updated incrementally whenever the status of a checker changes.
 
-    def __init__(self):
+        Example of usage:
+            checkers.addCondition("Boiler", conditions.All("SolarFlowChecker", "TemperatureDifferenceChecker"))
+            checkers["Boiler"].inLimit.connect(start)
+    """
+
+    def __init__(self, acquisition=None):
         self.logger = logging.getLogger(__name__)
         self.logger.info("Creating CheckerMaster.")
+        self.acquisition = acquisition
+        self.evaluator = None
+        # the checkers and the Batch submitted to the evaluator, until their results are reported
+        self._batch_ = None
         self._checkers_ = {}
         self._status_ = {}
+        self._indices_ = {}
+        self._leaves_ = {}
+        self._conditions_ = {}
 
     def stop(self, name=None):
         if not name:
             self.logger.info("Stopping all checkers.")
-            name = self.active
+            name = list(self._checkers_)
         elif type(name) == str:
             name = [name]
 
         for iName in name:
+            if trace.active:
+                trace.instant(f"stop {iName}", "checkermaster")
             self.logger.info(f"Stopping checker {iName}")
             self._checkers_[iName].stop()
             self._checkers_.pop(iName)
+            # a checker of the same name starts again without status
+            self._status_.pop(iName, None)
+            if iName in self._leaves_:
+                self._leaves_[iName]._set_(False)
 
     def __getitem__(self, name):
-        return self._checkers_[name]
+        if name in self._checkers_:
+            return self._checkers_[name]
+        return self._conditions_[name]
 
     def __setitem__(self, name, value):
         self._checkers_[name] = value
 
     def addChecker(self, checker):
         if checker.objectName():
+            if trace.active:
+                trace.instant(f"add {checker.objectName()}", "checkermaster")
             self._checkers_[checker.objectName()] = checker
-            self._status_[checker.objectName()] = False
+            self.changeStatus(checker.objectName(), False)
+            checker.inLimit.connect(partial(self.changeStatus, checker.objectName(), True))
+            checker.outLimit.connect(partial(self.changeStatus, checker.objectName(), False))
+            if self._parallel_(checker):
+                checker.pause()
         else:
             raise NameError("GeneralChecker is missing a name. Try initializing GeneralChecker with a name.")
 
+    def setEvaluator(self, evaluator):
+        r"""Evaluates the checkers of tags in worker processes.
+
+        From now on, checkers with a tag known to the shared history of the
+        evaluator no longer run on their own timers but are evaluated together
+        every time the acquisition has new data. Other checkers are not
+        affected.
+
+        Parameters
+        ----------
+        evaluator \: ParallelEvaluator
+            see tools.general.parallel
+        """
+        if self.acquisition is None:
+            raise RuntimeError("Evaluating checkers in worker processes needs an acquisition.")
+        self.logger.info("Evaluating checkers in worker processes.")
+        self.evaluator = evaluator
+        for iChecker in self._checkers_.values():
+            if self._parallel_(iChecker):
+                iChecker.pause()
+        self.acquisition.updated.connect(self.evaluate)
+
+    def _parallel_(self, checker):
+        return (self.evaluator is not None and isinstance(checker, GeneralChecker) and checker.byTag
+                and not checker.par["horizon"] and checker.par["tag"] in self.evaluator.history)
+
+    def evaluate(self):
+        r"""Submits all checkers of tags to the worker processes at once.
+
+        The event loop is not blocked while the workers evaluate, the results
+        are reported by _collect_ once ready. While the previous evaluation is
+        still running, the new data is not evaluated.
+        """
+        if self._batch_ is not None or not self.evaluator.update(self.acquisition.data, self.acquisition.dataTime):
+            # the workers still read the shared history, it must not be written
+            self.logger.warning("Checker workers still busy, skipping the evaluation of the latest data.")
+            return
+        checkers = [c for c in self._checkers_.values() if self._parallel_(c)]
+        if trace.active:
+            trace.instant("evaluate", "checkermaster", {"checkers": len(checkers)})
+        self._batch_ = (checkers, self.evaluator.submit([c.spec(self.evaluator.history) for c in checkers]))
+        QTimer.singleShot(self.evaluator.interval, self._collect_)
+
+    def _collect_(self):
+        checkers, batch = self._batch_
+        if not batch.ready():
+            QTimer.singleShot(self.evaluator.interval, self._collect_)
+            return
+        self._batch_ = None
+        values, _ = batch.result()
+        if trace.active:
+            trace.instant("evaluated", "checkermaster", {"checkers": len(checkers)})
+        for iChecker, iValue in zip(checkers, values):
+            # a checker can be stopped (and replaced) by a slot of one reported earlier or during the evaluation
+            if self._checkers_.get(iChecker.objectName()) is iChecker:
+                iChecker.report(iValue)
+
+    def addCondition(self, name, condition):
+        r"""Declares a composite condition over the status of named checkers.
+
+        The checkers do not need to exist yet, until then their status is False.
+        A condition with the same name is replaced.
+
+        Parameters
+        ----------
+        name \: str
+        condition \: Condition or dict
+            a condition tree or its description (see conditions.parse)
+
+        Returns
+        -------
+        Condition
+        """
+        if isinstance(condition, dict):
+            condition = conditions.parse(condition)
+        if name in self._conditions_:
+            self.removeCondition(name)
+        self.logger.info(f"Adding condition {name}.")
+        condition.setObjectName(name)
+        self._conditions_[name] = condition._attach_(self._leaf_)
+        return condition
+
+    def removeCondition(self, name):
+        self.logger.info(f"Removing condition {name}.")
+        self._conditions_.pop(name)._detach_()
+
+    def _leaf_(self, checker_name):
+        if checker_name not in self._leaves_:
+            self._leaves_[checker_name] = conditions.Leaf()
+            self._leaves_[checker_name]._status_ = self._status_.get(checker_name, False)
+        return self._leaves_[checker_name]
+
+    def addBand(self, signal, func, settings, name):
+        r"""Adds a pair of limits on a derived signal shared with other checkers.
+
+        All bands of the same signal are resolved by a single LimitChecker, which
+        is created with the settings of the first band and stopped with the
+        last one. The band is registered like any other checker under its name.
+        The bands of a signal differ only in their limits, the other settings
+        (the processing of the signal) have to be the same.
+
+        Parameters
+        ----------
+        signal \: str
+            the name of the derived signal, e.g. "TICA-101"
+        func \: function
+            see GeneralChecker, only used when the signal is not yet checked
+        settings \: dict
+            see GeneralChecker
+        name \: str
+            the name of the band
+
+        Returns
+        -------
+        Band
+
+        Raises
+        ------
+        ValueError
+            when the processing differs from the other bands of the signal
+        """
+        if signal in self._indices_ and self._indices_[signal].index:
+            current = LimitChecker.processing(self._indices_[signal].par)
+            differing = {k: v for k, v in LimitChecker.processing(settings).items() if current[k] != v}
+            if differing:
+                raise ValueError(f"Band {name} processes {signal} differently than its other bands ({differing}). "
+                                 f"Use another signal name for it.")
+        else:
+            self.logger.info(f"Creating limit index for {signal}.")
+            self._indices_[signal] = LimitChecker(func=func, settings=settings, name=signal,
+                                                  acquisition=self.acquisition)
+        band = self._indices_[signal].addBand(name, settings)
+        self.addChecker(band)
+        return band
+
     def changeStatus(self, checker_name, status):
+        if trace.active and self._status_.get(checker_name) != status:
+            trace.instant(f"{checker_name} {'in' if status else 'out'}", "status")
         self._status_[checker_name] = status
+        if checker_name in self._leaves_:
+            self._leaves_[checker_name]._set_(status)
 
     @property
     def activeCheckers(self):
@@ -232,4 +677,8 @@ class CheckerMaster(object):
 
     @property
     def statusCheckers(self):
-        return deepcopy(self._status_)
+        return dict(self._status_)
+
+    @property
+    def conditions(self):
+        return dict(self._conditions_)
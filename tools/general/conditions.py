@@ -0,0 +1,208 @@
+r"""
+Composite conditions over the status of named checkers.
+
+A condition is a boolean tree declared once, e.g. "both the flow and the
+temperature checkers are within their limits for at least 30 s":
+    Sustained(All("SolarFlowChecker", "TemperatureDifferenceChecker"), 30)
+or, as read from a configuration file:
+    {"for": 30, "of": {"all": ["SolarFlowChecker", "TemperatureDifferenceChecker"]}}
+
+Every node keeps the number of its children that are true, so a status change
+of a checker only updates the counters on its way up the tree and a node only
+emits inLimit/outLimit when its own status changes. The trees are registered
+at and resolved by the CheckerMaster (see CheckerMaster.addCondition).
+"""
+
+from tools.general.backend import QObject, pyqtSignal, QTimer
+from tools.general import trace
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Condition(QObject):
+    r"""
+
+        A node of a condition tree. Emits inLimit when it becomes true and
+        outLimit when it becomes false, like a checker.
+    """
+
+    outLimit = pyqtSignal()
+    inLimit = pyqtSignal()
+
+    def __init__(self, children=()):
+        super().__init__()
+        self.children = list(children)
+        self._parents_ = []
+        self._status_ = False
+
+    @property
+    def status(self):
+        return self._status_
+
+    def _set_(self, status):
+        if status == self._status_:
+            return
+        self._status_ = status
+        # a slot of a parent can detach the condition
+        for iParent in list(self._parents_):
+            iParent._childChanged_(status)
+        if self.objectName():
+            logger.info(f"Condition {self.objectName()} is {'met' if status else 'not met'}.")
+            if trace.active:
+                trace.instant(f"{self.objectName()} {'in' if status else 'out'}", "condition")
+        if status:
+            self.inLimit.emit()
+        else:
+            self.outLimit.emit()
+
+    def _childChanged_(self, status):
+        raise NotImplementedError
+
+    def _attach_(self, leaves):
+        r"""Replaces checker names by their leaves and links the children.
+
+        Parameters
+        ----------
+        leaves \: function
+            returns the Leaf of a checker name
+
+        Returns
+        -------
+        Condition
+            self
+        """
+        self.children = [leaves(iChild) if isinstance(iChild, str) else iChild._attach_(leaves)
+                         for iChild in self.children]
+        for iChild in self.children:
+            iChild._parents_.append(self)
+        self._reset_()
+        return self
+
+    def _detach_(self):
+        for iChild in self.children:
+            iChild._parents_.remove(self)
+            iChild._detach_()
+
+    def _reset_(self):
+        pass
+
+
+class Leaf(Condition):
+    r"""The status of one checker, set by the CheckerMaster."""
+
+    def _attach_(self, leaves):
+        return self
+
+    def _detach_(self):
+        pass
+
+
+class AtLeast(Condition):
+    r"""
+
+        True when at least k of the children are true.
+
+        Parameters
+        ----------
+        k \: int
+        \*children \: str or Condition
+            checker names or conditions
+    """
+
+    def __init__(self, k, *children):
+        super().__init__(children)
+        self.k = k
+        self._true_ = 0
+
+    def _reset_(self):
+        self._true_ = sum(iChild.status for iChild in self.children)
+        self._status_ = self._true_ >= self.k
+
+    def _childChanged_(self, status):
+        self._true_ += 1 if status else -1
+        self._set_(self._true_ >= self.k)
+
+
+class All(AtLeast):
+    r"""True when all children are true."""
+
+    def __init__(self, *children):
+        super().__init__(len(children), *children)
+
+
+class Any(AtLeast):
+    r"""True when any of the children is true."""
+
+    def __init__(self, *children):
+        super().__init__(1, *children)
+
+
+class Sustained(Condition):
+    r"""
+
+        True when the child has been true for at least a number of seconds.
+
+        Parameters
+        ----------
+        child \: str or Condition
+        seconds \: int or float
+    """
+
+    def __init__(self, child, seconds):
+        super().__init__([child])
+        self.seconds = seconds
+        self._timer_ = QTimer()
+        self._timer_.setSingleShot(True)
+        self._timer_.setInterval(int(seconds * 1000))
+        self._timer_.timeout.connect(self._elapsed_)
+
+    def _reset_(self):
+        self._status_ = False
+        if self.children[0].status:
+            self._timer_.start()
+
+    def _childChanged_(self, status):
+        if status:
+            self._timer_.start()
+        else:
+            self._timer_.stop()
+            self._set_(False)
+
+    def _elapsed_(self):
+        if self.children[0].status:
+            self._set_(True)
+
+    def _detach_(self):
+        self._timer_.stop()
+        super()._detach_()
+
+
+def parse(spec):
+    r"""Builds a condition tree from its description in a configuration.
+
+    Parameters
+    ----------
+    spec \: str or dict
+        a checker name or one of
+            {"all": [spec, ...]}
+            {"any": [spec, ...]}
+            {"atleast": k, "of": [spec, ...]}
+            {"for": seconds, "of": spec}
+
+    Returns
+    -------
+    str or Condition
+    """
+    if isinstance(spec, str):
+        return spec
+    if isinstance(spec, dict):
+        if "all" in spec:
+            return All(*map(parse, spec["all"]))
+        if "any" in spec:
+            return Any(*map(parse, spec["any"]))
+        if "atleast" in spec:
+            return AtLeast(spec["atleast"], *map(parse, spec["of"]))
+        if "for" in spec:
+            return Sustained(parse(spec["of"]), spec["for"])
+    raise ValueError(f"Condition not understood: {spec}.")
@@ -5,10 +5,13 @@ Created on Thu May 27 13:27:36 2021
 @author: mohanam
 """
 
+import asyncio
 from functools import partial
 from types import MethodType
 import datetime as dt
 
+from tools.general import trace
+
 from cRIO_comms.cRIOFormats import cRIOSetpoint
 from cRIO_comms.cRIOCommunication import cRIOWebServerComms
 
@@ -45,10 +48,29 @@ class ControlSystemMap(object):
         pandas.Series
             index being the tag name, values containing the values
         '''
-        self.__data, self.__units = self.crio_communication.getCurrentData()
-        self.__dataTime = dt.datetime.now()
+        if trace.active:
+            trace.begin("getCurrentData", "crio")
+        try:
+            self.__data, self.__units = self.crio_communication.getCurrentData()
+            self.__dataTime = dt.datetime.now()
+        finally:
+            if trace.active:
+                trace.end("getCurrentData", "crio")
         return self.__data
         
+    async def getCurrentDataAsync(self):
+        '''
+        Requests latest data from the cRIO without blocking the event loop of
+        the headless runtime (see tools.general.runtime).
+
+        Returns
+        -------
+        pandas.Series
+            index being the tag name, values containing the values
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.getCurrentData)
+
     def getLastData(self, window=5):
         '''
         Gets the last data from the cRIO stored internally as long as it is 
@@ -115,6 +137,8 @@ class Attribute(object):
         if hasattr(obj, "get_Range_Min") and hasattr(obj, "get_Range_Max"):
             if not(obj.get_Range_Min() <= x <= obj.get_Range_Max()):
                 raise ValueError("Command not sent. Value seems to be out of bounds.")
+        if trace.active:
+            trace.instant("setSetpoint", "crio", {"tag": obj.tag, "value": x})
         obj.system.crio_communication.setSetpoint(cRIOSetpoint(obj.tag, x))
 
 
@@ -169,6 +193,7 @@ if __name__ == "__main__":
                  "T_out": "TI-422b"}
               }
      
+    # a running control process serves these as KPIs, see tools.general.snapshot
     loops = {}
     for iLoop, iSensors in _loops.items():
         loops[iLoop] = {"Flow": c.Process_Values[iSensors["Flow"]].PV.get_Value,
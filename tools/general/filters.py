@@ -0,0 +1,199 @@
+r"""
+Filter bank used by the checkers to smooth the checked signal or to estimate
+its derivatives.
+
+The coefficients of the linear filters are memoized process-wide, keyed by
+(kind, order, window), so constructing many checkers with the same settings
+calculates them only once. The returned arrays are read-only as they are
+shared between the checkers.
+
+The coefficients are ordered from the oldest to the newest sample, i.e. the
+same order as the data in the windows of the checkers. All filters are causal:
+they estimate the value (or derivative) at the newest sample.
+
+Available kinds:
+    mean \: flat moving average (order 0 only)
+    backward \: backward finite differences (order > 0)
+    savgol \: Savitzky-Golay smoothing (order 0) and derivatives (order > 0)
+    ema \: exponential moving average truncated to the window (order 0 only)
+    median \: moving median, non-linear and therefore without coefficients
+"""
+
+from functools import lru_cache
+from math import factorial
+
+
+KINDS = ("mean", "backward", "savgol", "ema", "median")
+
+
+def default(order):
+    r"""Returns the filter kind used when a checker does not select one.
+
+    Parameters
+    ----------
+    order \: int
+        the order of the derivative
+
+    Returns
+    -------
+    str
+    """
+    return "backward" if order > 0 else "mean"
+
+
+def window(kind, order, acc):
+    r"""Returns the number of samples the filter needs.
+
+    Parameters
+    ----------
+    kind \: str
+    order \: int
+        the order of the derivative
+    acc \: int
+        the accuracy setting of the checker
+
+    Returns
+    -------
+    int
+    """
+    if kind == "backward":
+        # backward differences need acc + order points
+        return acc + order
+    return acc + 1
+
+
+def check(kind, order, window):
+    r"""Validates a filter without calculating its coefficients.
+
+    Parameters
+    ----------
+    kind \: str
+    order \: int
+        the order of the derivative
+    window \: int
+        the number of samples the filter spans
+
+    Raises
+    ------
+    ValueError
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown filter {kind}. Choose from {KINDS}.")
+    if order > 0 and kind not in ("backward", "savgol"):
+        raise ValueError(f"The {kind} filter does not support derivatives.")
+    if window < 1:
+        raise ValueError("The filter window should contain at least one sample.")
+    if kind == "backward":
+        # findiff only calculates derivatives, with an even positive accuracy
+        if order == 0:
+            raise ValueError("The backward filter only calculates derivatives, use another filter for order 0.")
+        if window - order <= 0 or (window - order) % 2:
+            raise ValueError(f"A backward derivative needs a positive even acc, not {window - order}.")
+    if kind == "savgol" and order > min(max(order, 2), window - 1):
+        raise ValueError(f"A Savitzky-Golay derivative of order {order} needs more than {window} samples.")
+
+
+@lru_cache(maxsize=None)
+def coefficients(kind, order, window):
+    r"""Calculates the coefficients of a linear filter.
+
+    Parameters
+    ----------
+    kind \: str
+        one of KINDS except "median"
+    order \: int
+        the order of the derivative
+    window \: int
+        the number of samples the filter spans
+
+    Returns
+    -------
+    numpy.ndarray
+        read-only coefficients from the oldest to the newest sample
+    """
+    check(kind, order, window)
+    import numpy as np
+
+    if kind == "mean":
+        coef = np.full(window, 1 / window)
+    elif kind == "backward":
+        import findiff
+        coef = findiff.coefficients(deriv=order, acc=window - order)["backward"]["coefficients"]
+        coef = np.asarray(coef, dtype=float)
+    elif kind == "savgol":
+        coef = _savgol_(order, window)
+    elif kind == "ema":
+        alpha = 2 / (window + 1)
+        coef = alpha * (1 - alpha) ** np.arange(window - 1, -1, -1)
+        coef = coef / coef.sum()
+    else:
+        raise ValueError("The median filter has no coefficients.")
+    coef.setflags(write=False)
+    return coef
+
+
+def _savgol_(order, window):
+    r"""Fits a polynomial through the window by least squares and evaluates its
+    derivative at the newest sample.
+
+    The polynomial degree is the lowest of two and the order of the derivative
+    that still smooths, limited by the number of samples.
+    """
+    import numpy as np
+
+    polyorder = min(max(order, 2), window - 1)
+    x = np.arange(-window + 1, 1, dtype=float)
+    A = np.vander(x, polyorder + 1, increasing=True)
+    return factorial(order) * np.linalg.pinv(A)[order]
+
+
+def apply(kind, order, window, y):
+    r"""Filters the window and returns the value at the newest sample.
+
+    Samples that are NaN (not yet available) are ignored.
+
+    Parameters
+    ----------
+    kind \: str
+    order \: int
+    window \: int
+    y \: array_like
+        the last window samples from the oldest to the newest
+
+    Returns
+    -------
+    float
+    """
+    import numpy as np
+
+    y = np.asarray(y, dtype=float)
+    if kind == "median":
+        return np.nanmedian(y) if not np.isnan(y).all() else float('nan')
+    return np.nansum(coefficients(kind, order, window) * y)
+
+
+def convolve(kind, order, window, y):
+    r"""Filters a whole series at once.
+
+    Parameters
+    ----------
+    kind \: str
+    order \: int
+    window \: int
+    y \: array_like
+        the samples from the oldest to the newest
+
+    Returns
+    -------
+    numpy.ndarray
+        one value for every sample having a full window behind it
+    """
+    import numpy as np
+
+    y = np.asarray(y, dtype=float)
+    if len(y) < window:
+        return np.empty(0)
+    if kind == "median":
+        return np.median(np.lib.stride_tricks.sliding_window_view(y, window), axis=-1)
+    # np.convolve flips the kernel, hence the reversed coefficients
+    return np.convolve(y, coefficients(kind, order, window)[::-1], mode="valid")
@@ -0,0 +1,219 @@
+import threading
+from collections import deque
+from math import ceil
+from numbers import Number
+
+import logging
+
+
+class SummaryPyramid(object):
+    r"""
+
+        Multi-resolution aggregates of one signal.
+
+        Every level splits the time in buckets of a fixed resolution (by
+        default 1 s, 1 min and 1 h) and keeps the sum, minimum, maximum, count
+        and the first and last samples of each bucket. A query over a horizon
+        uses the coarsest buckets that lay completely within it and only falls
+        back to finer levels at its edges. The number of buckets visited is
+        therefore bounded by the ratio between the levels, so a query over two
+        hours costs about the same as one over a minute.
+
+        Example of usage:
+            pyramid = SummaryPyramid()
+            pyramid.append(time.time(), 52.3)
+            pyramid.query("mean", 30 * 60)
+
+        Parameters
+        ----------
+        resolutions \: tuple of int or float
+            the bucket sizes in seconds from fine to coarse
+        retention \: tuple of int
+            the number of buckets kept for every level
+    """
+
+    aggregates = ("mean", "min", "max", "der", "count")
+
+    def __init__(self, resolutions=(1, 60, 3600), retention=(3600, 1440, 168)):
+        if len(resolutions) != len(retention):
+            raise ValueError("Every resolution needs a retention.")
+        self.resolutions = tuple(resolutions)
+        self._levels_ = [{} for _ in self.resolutions]
+        self._keys_ = [deque(maxlen=n) for n in retention]
+        self.last = None
+
+    def append(self, t, value):
+        r"""Adds a sample to all levels.
+
+        Parameters
+        ----------
+        t \: float
+            the time of the sample in seconds
+        value \: int or float
+            NaN values are ignored
+        """
+        if value != value:
+            return
+        self.last = (t, value)
+        for resolution, buckets, keys in zip(self.resolutions, self._levels_, self._keys_):
+            k = int(t // resolution)
+            bucket = buckets.get(k)
+            if bucket is None:
+                if len(keys) == keys.maxlen:
+                    buckets.pop(keys[0], None)
+                keys.append(k)
+                # sum, min, max, count, (t, first), (t, last)
+                buckets[k] = [value, value, value, 1, (t, value), (t, value)]
+            else:
+                bucket[0] += value
+                bucket[1] = min(bucket[1], value)
+                bucket[2] = max(bucket[2], value)
+                bucket[3] += 1
+                if t < bucket[4][0]:
+                    bucket[4] = (t, value)
+                if t >= bucket[5][0]:
+                    bucket[5] = (t, value)
+
+    def _retains_(self, level, t):
+        r"""Whether the level still holds all buckets since the time t."""
+        keys = self._keys_[level]
+        return len(keys) < keys.maxlen or keys[0] * self.resolutions[level] <= t
+
+    def _cover_(self, level, start, end, out):
+        r"""Collects the buckets covering [start, end) preferring coarse ones.
+
+        An edge is only resolved by a finer level while that level still
+        retains it, otherwise the coarse bucket of the edge is used, which
+        may include samples up to one coarse resolution outside the edge.
+        """
+        resolution = self.resolutions[level]
+        buckets = self._levels_[level]
+        if level == 0:
+            for k in range(int(start // resolution), ceil(end / resolution)):
+                if k in buckets:
+                    out.append(buckets[k])
+            return
+        first = ceil(start / resolution)
+        last = int(end // resolution)
+        if first >= last:
+            if self._retains_(level - 1, start):
+                self._cover_(level - 1, start, end, out)
+            elif int(start // resolution) in buckets:
+                out.append(buckets[int(start // resolution)])
+            return
+        if start < first * resolution:
+            if self._retains_(level - 1, start):
+                self._cover_(level - 1, start, first * resolution, out)
+            elif first - 1 in buckets:
+                out.append(buckets[first - 1])
+        for k in range(first, last):
+            if k in buckets:
+                out.append(buckets[k])
+        if last * resolution < end:
+            self._cover_(level - 1, last * resolution, end, out)
+
+    def query(self, aggregate, horizon, now=None):
+        r"""Aggregates the samples of the last horizon seconds.
+
+        The edges are resolved to the finest resolution.
+
+        Parameters
+        ----------
+        aggregate \: str
+            "mean", "min", "max", "der" (change per second between the first and
+            last sample) or "count"
+        horizon \: int or float
+            seconds
+        now \: float
+            the end of the horizon, defaults to the time of the last sample
+
+        Returns
+        -------
+        float
+            NaN when there are no samples within the horizon
+        """
+        if aggregate not in SummaryPyramid.aggregates:
+            raise ValueError(f"Unknown aggregate {aggregate}. Choose from {SummaryPyramid.aggregates}.")
+        if self.last is None:
+            return float('nan') if aggregate != "count" else 0
+        if now is None:
+            now = self.last[0]
+        # the end is extended to the end of the finest bucket containing now
+        end = (int(now // self.resolutions[0]) + 1) * self.resolutions[0]
+        buckets = []
+        self._cover_(len(self.resolutions) - 1, now - horizon, end, buckets)
+
+        count = sum(b[3] for b in buckets)
+        if aggregate == "count":
+            return count
+        if not count:
+            return float('nan')
+        if aggregate == "mean":
+            return sum(b[0] for b in buckets) / count
+        if aggregate == "min":
+            return min(b[1] for b in buckets)
+        if aggregate == "max":
+            return max(b[2] for b in buckets)
+        first = min(b[4] for b in buckets)
+        last = max(b[5] for b in buckets)
+        if last[0] == first[0]:
+            return float('nan')
+        return (last[1] - first[1]) / (last[0] - first[0])
+
+
+class HistoryStore(object):
+    r"""
+
+        Holds a SummaryPyramid for every tag (or derived signal).
+
+        Appending and querying hold lock, so the store can be read from other
+        threads (e.g. by tools.general.snapshot) while the acquisition appends.
+        Several queries that should see the same samples can hold it too.
+
+        Parameters
+        ----------
+        \*\*kwargs \: dict
+            passed to every SummaryPyramid
+    """
+
+    def __init__(self, **kwargs):
+        self.logger = logging.getLogger(__name__)
+        self._kwargs_ = kwargs
+        self._pyramids_ = {}
+        self.lock = threading.RLock()
+
+    def __getitem__(self, tag):
+        return self._pyramids_[tag]
+
+    def __contains__(self, tag):
+        return tag in self._pyramids_
+
+    @property
+    def tags(self):
+        return list(self._pyramids_)
+
+    def pyramid(self, tag):
+        r"""Returns the pyramid of the tag, creating it when needed."""
+        if tag not in self._pyramids_:
+            self.logger.debug(f"Creating history of {tag}.")
+            self._pyramids_[tag] = SummaryPyramid(**self._kwargs_)
+        return self._pyramids_[tag]
+
+    def append(self, t, values):
+        r"""Adds one sample of several tags.
+
+        Parameters
+        ----------
+        t \: float
+            the time of the sample in seconds
+        values \: dict or pandas.Series
+            tag name and value, values that are not numbers are skipped
+        """
+        with self.lock:
+            for iTag, iValue in values.items():
+                if isinstance(iValue, Number):
+                    self.pyramid(iTag).append(t, iValue)
+
+    def query(self, tag, aggregate, horizon, now=None):
+        with self.lock:
+            return self._pyramids_[tag].query(aggregate, horizon, now)
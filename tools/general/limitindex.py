@@ -0,0 +1,151 @@
+from bisect import bisect_left
+import math
+
+import logging
+
+
+class LimitIndex(object):
+    r"""
+
+        Holds all the limits (bands) that are checked against one derived
+        signal in sorted order.
+
+        The sorted, unique limits split the real axis into elementary pieces:
+        the open intervals between two consecutive limits and the limits
+        themselves. For every piece the set of bands containing it is computed
+        once when a band is added or removed. Resolving a new value is then a
+        binary search for its piece followed by a set lookup.
+
+        The comparison is the same as in GeneralChecker._check_, i.e. a value is
+        within a band when lowlimit < value < highlimit.
+
+        Example of usage:
+            index = LimitIndex("TICA-101")
+            index.addBand("Charge", lowlimit=50)
+            index.addBand("Discharge", highlimit=20)
+            entered, left = index.update(55)  # ({"Charge"}, {"Discharge"})
+
+        Parameters
+        ----------
+        signal \: str
+            the name of the derived signal the limits belong to
+    """
+
+    def __init__(self, signal=""):
+        self.logger = logging.getLogger(__name__)
+        self.signal = signal
+        self._bands_ = {}
+        self._limits_ = []
+        self._pieces_ = [frozenset()]
+        self._inside_ = frozenset()
+        self._pending_ = set()
+
+    def __len__(self):
+        return len(self._bands_)
+
+    def __contains__(self, name):
+        return name in self._bands_
+
+    @property
+    def limits(self):
+        return list(self._limits_)
+
+    def addBand(self, name, lowlimit=-float('inf'), highlimit=float('inf')):
+        self.logger.debug(f"Adding band {name} ({lowlimit}, {highlimit}) to {self.signal}.")
+        self._bands_[name] = (lowlimit, highlimit)
+        self._pending_.add(name)
+        self._rebuild_()
+
+    def removeBand(self, name):
+        self.logger.debug(f"Removing band {name} from {self.signal}.")
+        self._bands_.pop(name)
+        self._pending_.discard(name)
+        self._inside_ = self._inside_ - {name}
+        self._rebuild_()
+
+    def _rebuild_(self):
+        r"""Sorts the limits and computes the bands containing each piece.
+
+        Piece 2*i is the open interval below self._limits_[i] (and above the
+        previous limit), piece 2*i+1 is the limit self._limits_[i] itself. The
+        last piece is the open interval above the highest limit.
+        """
+        limits = set()
+        for low, high in self._bands_.values():
+            limits.update((low, high))
+        self._limits_ = sorted(limits)
+
+        representatives = []
+        previous = -float('inf')
+        for limit in self._limits_:
+            representatives.append(self._between_(previous, limit))
+            representatives.append(limit)
+            previous = limit
+        representatives.append(self._between_(previous, float('inf')))
+
+        self._pieces_ = [frozenset(name for name, (low, high) in self._bands_.items() if low < x < high)
+                         for x in representatives]
+
+    @staticmethod
+    def _between_(low, high):
+        r"""Returns a value strictly between two consecutive limits.
+
+        The offset from an open end grows with the limit, a fixed one would be
+        absorbed by large limits (e.g. 1e20 - 1 == 1e20).
+        """
+        if low == -float('inf') and high == float('inf'):
+            return 0.
+        if low == -float('inf'):
+            x = high - max(1., abs(high))
+            return x if x > low else math.nextafter(high, low)
+        if high == float('inf'):
+            x = low + max(1., abs(low))
+            return x if x < high else math.nextafter(low, high)
+        # halved first, the difference of two large limits can overflow
+        return low / 2 + high / 2
+
+    def bands(self, value):
+        r"""Returns the names of the bands containing the value.
+
+        Parameters
+        ----------
+        value \: int or float
+
+        Returns
+        -------
+        frozenset
+        """
+        if value != value:
+            # NaN is never within limits
+            return frozenset()
+        i = bisect_left(self._limits_, value)
+        if i < len(self._limits_) and self._limits_[i] == value:
+            return self._pieces_[2 * i + 1]
+        return self._pieces_[2 * i]
+
+    def update(self, value):
+        r"""Resolves a new value and returns the bands whose status changed.
+
+        Bands added since the last update are always reported.
+
+        Parameters
+        ----------
+        value \: int or float
+
+        Returns
+        -------
+        tuple of sets
+            the names of the bands the value entered and the names of the bands
+            the value left
+        """
+        inside = self.bands(value)
+        entered = (inside - self._inside_) | (inside & self._pending_)
+        left = (self._inside_ - inside) | (self._pending_ - inside)
+        self._inside_ = inside
+        self._pending_ = set()
+        return entered, left
+
+    def reset(self):
+        r"""Forgets the last status so the next update reports all bands."""
+        self._inside_ = frozenset()
+        self._pending_ = set(self._bands_)
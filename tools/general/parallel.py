@@ -0,0 +1,286 @@
+r"""
+Optional multi-core evaluation of large sets of checkers.
+
+The latest samples of all tags are kept in a ring buffer in shared memory
+(SharedHistory). A pool of worker processes attaches to it once and reads the
+windows of the checkers without copying them. For every checker the workers
+only receive a compact description (the tag column, the filter and the limits)
+and only return the filtered value and the status, so the cost of sending
+work to the workers does not grow with the window length.
+
+The buffer is written between evaluations by the process owning it, the
+workers only read it during an evaluation. An evaluation is submitted without
+waiting for it (ParallelEvaluator.submit), so the event loop keeps running
+while the workers evaluate; its results are collected once ready.
+
+Example of usage:
+    history = SharedHistory(tags, capacity=4096)
+    evaluator = ParallelEvaluator(history, workers=4)
+    checkers.setEvaluator(evaluator)  # see CheckerMaster
+or from the evaluator settings of a units file (see tools.units):
+    evaluator = fromSettings({"tags": tags, "capacity": 4096, "workers": 4})
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tools.general import filters
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SharedHistory(object):
+    r"""
+
+        A ring buffer of the latest samples of a fixed set of tags in shared
+        memory.
+
+        Every sample is written twice, at position i and i + capacity, so the
+        last n samples of a tag are always one contiguous slice and can be read
+        without copying.
+
+        Parameters
+        ----------
+        tags \: list of str
+        capacity \: int
+            the longest window that can be read
+        name \: str
+            the name of an existing buffer to attach to, a new buffer is created
+            when None
+    """
+
+    def __init__(self, tags, capacity, name=None):
+        self.tags = list(tags)
+        self.capacity = capacity
+        self._columns_ = {iTag: i for i, iTag in enumerate(self.tags)}
+        size = 8 + 8 * len(self.tags) * 2 * capacity
+        self._owner_ = name is None
+        self._shm_ = shared_memory.SharedMemory(name=name, create=self._owner_, size=size)
+        self._count_ = np.ndarray((1,), dtype=np.int64, buffer=self._shm_.buf)
+        self._data_ = np.ndarray((len(self.tags), 2 * capacity), dtype=np.float64, buffer=self._shm_.buf, offset=8)
+        if self._owner_:
+            self._count_[0] = 0
+            self._data_[:] = np.nan
+        self._lastTime_ = None
+
+    @property
+    def name(self):
+        return self._shm_.name
+
+    @property
+    def count(self):
+        return int(self._count_[0])
+
+    def __contains__(self, tag):
+        return tag in self._columns_
+
+    def column(self, tag):
+        return self._columns_[tag]
+
+    def append(self, row):
+        r"""Adds one sample of all tags.
+
+        Parameters
+        ----------
+        row \: array_like
+            the values in the order of the tags
+        """
+        i = self.count % self.capacity
+        self._data_[:, i] = row
+        self._data_[:, i + self.capacity] = row
+        self._count_[0] += 1
+
+    def update(self, data, t):
+        r"""Adds the newest sample of a DataFrame once per acquisition.
+
+        Parameters
+        ----------
+        data \: pandas.DataFrame
+            columns being the tags
+        t \: float
+            the time of the acquisition, a sample of the same time is not added
+            again
+        """
+        if data is None or t == self._lastTime_:
+            return
+        self._lastTime_ = t
+        latest = data.iloc[-1]
+        self.append([latest.get(iTag, np.nan) for iTag in self.tags])
+
+    def window(self, column, n):
+        r"""Returns a view on the last n samples of a tag, oldest first."""
+        if n > self.capacity:
+            raise ValueError(f"Window of {n} samples is longer than the history ({self.capacity}).")
+        end = (self.count - 1) % self.capacity + self.capacity + 1
+        return self._data_[column, end - n:end]
+
+    def close(self):
+        del self._count_, self._data_
+        self._shm_.close()
+        if self._owner_:
+            self._shm_.unlink()
+
+
+_history_ = None
+
+
+def _attach_(tags, capacity, name):
+    global _history_
+    _history_ = SharedHistory(tags, capacity, name)
+
+
+def _evaluate_(specs):
+    r"""Evaluates checkers in a worker.
+
+    Parameters
+    ----------
+    specs \: list of tuple
+        (column, filter kind, order, window, lowlimit, highlimit)
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        the values and the statuses
+    """
+    values = np.empty(len(specs))
+    for i, (column, kind, order, window, low, high) in enumerate(specs):
+        values[i] = filters.apply(kind, order, window, _history_.window(column, window))
+    lows = np.array([s[4] for s in specs], dtype=float)
+    highs = np.array([s[5] for s in specs], dtype=float)
+    return values, (lows < values) & (values < highs)
+
+
+class Batch(object):
+    r"""
+
+        An evaluation submitted to the workers, see ParallelEvaluator.submit.
+
+        Parameters
+        ----------
+        size \: int
+            the number of specs
+        workers \: int
+        result \: multiprocessing.pool.AsyncResult
+            of the chunks, None when there is nothing to evaluate
+    """
+
+    def __init__(self, size, workers, result=None):
+        self.size = size
+        self.workers = workers
+        self._result_ = result
+
+    def ready(self):
+        return self._result_ is None or self._result_.ready()
+
+    def result(self, timeout=None):
+        r"""Returns the values and the statuses in the order of the specs, waiting when not ready."""
+        values, statuses = np.empty(self.size), np.empty(self.size, dtype=bool)
+        if self._result_ is None:
+            return values, statuses
+        for i, (iValues, iStatuses) in enumerate(self._result_.get(timeout)):
+            values[i::self.workers] = iValues
+            statuses[i::self.workers] = iStatuses
+        return values, statuses
+
+
+class ParallelEvaluator(object):
+    r"""
+
+        Evaluates checker descriptions over a SharedHistory in a pool of worker
+        processes.
+
+        Parameters
+        ----------
+        history \: SharedHistory
+        workers \: int
+            defaults to the number of cores
+        interval \: int or float
+            the miliseconds between checking whether a submitted evaluation is
+            ready (see CheckerMaster.evaluate)
+    """
+
+    def __init__(self, history, workers=None, interval=5):
+        self.history = history
+        self.workers = workers or multiprocessing.cpu_count()
+        self.interval = interval
+        self._batches_ = []
+        logger.info(f"Starting {self.workers} checker workers.")
+        self._pool_ = multiprocessing.get_context("spawn").Pool(
+            self.workers, initializer=_attach_, initargs=(history.tags, history.capacity, history.name))
+
+    @property
+    def busy(self):
+        r"""Whether the workers are still reading the history for a submitted evaluation."""
+        self._batches_ = [iBatch for iBatch in self._batches_ if not iBatch.ready()]
+        return bool(self._batches_)
+
+    def update(self, data, t):
+        r"""Adds the newest sample to the history unless the workers are reading it.
+
+        Returns
+        -------
+        bool
+            whether the history holds the sample of t
+        """
+        if t != self.history._lastTime_ and self.busy:
+            return False
+        self.history.update(data, t)
+        return True
+
+    def submit(self, specs):
+        r"""Starts evaluating the checkers, split evenly over the workers,
+        without waiting for them.
+
+        Parameters
+        ----------
+        specs \: list of tuple
+            see GeneralChecker.spec
+
+        Returns
+        -------
+        Batch
+        """
+        if not specs:
+            return Batch(0, self.workers)
+        chunks = [specs[i::self.workers] for i in range(self.workers) if specs[i::self.workers]]
+        batch = Batch(len(specs), self.workers, self._pool_.map_async(_evaluate_, chunks))
+        self._batches_.append(batch)
+        return batch
+
+    def evaluate(self, specs):
+        r"""Evaluates the checkers and waits for the result.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            the values and the statuses in the order of the specs
+        """
+        return self.submit(specs).result()
+
+    def close(self):
+        self._pool_.close()
+        self._pool_.join()
+
+
+def fromSettings(settings):
+    r"""Creates a SharedHistory and a ParallelEvaluator over it.
+
+    Parameters
+    ----------
+    settings \: dict
+        tags \: list of str
+            the tags kept in the shared history
+        capacity \: int
+            the longest window, by default 4096 samples
+        workers \: int
+            by default the number of cores
+
+    Returns
+    -------
+    ParallelEvaluator
+    """
+    history = SharedHistory(settings["tags"], settings.get("capacity", 4096))
+    return ParallelEvaluator(history, settings.get("workers"))
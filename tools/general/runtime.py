@@ -0,0 +1,507 @@
+r"""
+Headless runtime running the mashinas, the checkers and the state machines on
+an asyncio event loop instead of Qt.
+
+It provides the small part of the PyQt5 API used in this package (QObject,
+pyqtSignal, QTimer, QState, QStateMachine and QApplication) with the same
+names and call signatures, so that the rest of the package does not need to
+know which one is used. The backend is selected in tools.general.backend.
+
+Signals are emitted synchronously like direct Qt connections. Slots that are
+coroutine functions are scheduled as tasks on the loop, which allows async I/O
+(e.g. towards the cRIO) to be done natively. State machine transitions are
+queued on the loop like in Qt, so signals emitted within onEntry are handled
+once the entry has finished.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import sys
+import time
+
+from tools.general import trace
+
+logger = logging.getLogger(__name__)
+
+_loop_ = None
+_scheduler_ = None
+_senders_ = []
+
+
+def loop():
+    r"""Returns the event loop of the runtime, creating it when needed."""
+    global _loop_
+    if _loop_ is None or _loop_.is_closed():
+        _loop_ = asyncio.new_event_loop()
+        _loop_.set_exception_handler(_onException_)
+        asyncio.set_event_loop(_loop_)
+    return _loop_
+
+
+def _onException_(loop, context):
+    # exceptions of slots and timers end up here instead of in sys.excepthook
+    exception = context.get("exception")
+    trace.error(f"{type(exception).__name__}: {exception}" if exception else context.get("message", ""))
+    loop.default_exception_handler(context)
+
+
+class AsyncioScheduler(object):
+    r"""Schedules the callbacks of the timers on the asyncio event loop."""
+
+    def callLater(self, delay, callback):
+        r"""Calls callback after delay seconds.
+
+        Returns
+        -------
+        handle
+            an object with a cancel() method
+        """
+        return loop().call_later(delay, callback)
+
+    def time(self):
+        return time.monotonic()
+
+
+class VirtualScheduler(object):
+    r"""
+
+        Schedules the callbacks of the timers on a virtual clock, without an
+        event loop. Time only passes when advance is called, so hours of
+        operation can be simulated in seconds (see tools.soak).
+
+        The wall-clock duration of every callback is kept in latencies.
+    """
+
+    class Handle(object):
+
+        def __init__(self):
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self):
+        self._now_ = 0.
+        self._queue_ = []
+        self._sequence_ = itertools.count()
+        self.latencies = []
+
+    def callLater(self, delay, callback):
+        handle = VirtualScheduler.Handle()
+        heapq.heappush(self._queue_, (self._now_ + max(delay, 0.), next(self._sequence_), callback, handle))
+        return handle
+
+    def time(self):
+        return self._now_
+
+    @property
+    def pending(self):
+        return sum(not iHandle.cancelled for *_, iHandle in self._queue_)
+
+    def advance(self, seconds):
+        r"""Runs all callbacks due within the next seconds, in order."""
+        end = self._now_ + seconds
+        while self._queue_ and self._queue_[0][0] <= end:
+            due, _, callback, handle = heapq.heappop(self._queue_)
+            if handle.cancelled:
+                continue
+            self._now_ = due
+            start = time.perf_counter()
+            callback()
+            self.latencies.append(time.perf_counter() - start)
+        self._now_ = end
+
+
+def scheduler():
+    r"""Returns the scheduler used by the timers and the state machines."""
+    global _scheduler_
+    if _scheduler_ is None:
+        _scheduler_ = AsyncioScheduler()
+    return _scheduler_
+
+
+def setScheduler(new):
+    r"""Replaces the scheduler used by the timers and the state machines.
+
+    Should be done before any timer is started.
+    """
+    global _scheduler_
+    _scheduler_ = new
+
+
+class BoundSignal(object):
+    r"""
+
+        A signal of one object. Holds the connected slots.
+
+        Parameters
+        ----------
+        owner \: Object
+            the object emitting the signal
+        name \: str
+    """
+
+    def __init__(self, owner, name):
+        self._owner_ = owner
+        self._name_ = name
+        self._slots_ = []
+
+    def connect(self, slot):
+        self._slots_.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self._slots_.clear()
+        else:
+            try:
+                self._slots_.remove(slot)
+            except ValueError:
+                # raises like Qt when the slot is not connected
+                raise TypeError(f"{slot} is not connected to {self._name_}.")
+
+    @property
+    def receivers(self):
+        return len(self._slots_)
+
+    def emit(self, *args):
+        if trace.active:
+            trace.instant(self._name_, "signal", {"sender": self._owner_.objectName() or type(self._owner_).__name__})
+        _senders_.append(self._owner_)
+        try:
+            for iSlot in list(self._slots_):
+                if asyncio.iscoroutinefunction(iSlot):
+                    loop().create_task(iSlot(*args))
+                else:
+                    iSlot(*args)
+        finally:
+            _senders_.pop()
+
+    def __call__(self, *args):
+        # allows connecting a signal to another signal like in Qt
+        self.emit(*args)
+
+    def __repr__(self):
+        return f"<signal {self._name_} of {self._owner_!r}>"
+
+
+class Signal(object):
+    r"""
+
+        Declares a signal on a class, like pyqtSignal.
+
+        Parameters
+        ----------
+        \*types \: type
+            the types of the emitted arguments (not checked)
+    """
+
+    def __init__(self, *types):
+        self.types = types
+        self.name = ""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        signals = instance.__dict__.setdefault("_signals_", {})
+        if self.name not in signals:
+            signals[self.name] = BoundSignal(instance, self.name)
+        return signals[self.name]
+
+
+def slot(*types, **kwargs):
+    r"""Replaces the pyqtSlot decorator, it has no effect."""
+    def decorator(func):
+        return func
+    return decorator
+
+
+class Object(object):
+    r"""
+
+        Replaces QObject: a name, an optional parent and the sender of the
+        signal being handled.
+    """
+
+    def __init__(self, parent=None):
+        self._objectName_ = ""
+        self._parent_ = parent
+
+    def objectName(self):
+        return self._objectName_
+
+    def setObjectName(self, name):
+        self._objectName_ = name
+
+    def parent(self):
+        return self._parent_
+
+    def setParent(self, parent):
+        self._parent_ = parent
+
+    def sender(self):
+        return _senders_[-1] if _senders_ else None
+
+
+class Timer(Object):
+    r"""
+
+        Replaces QTimer. The interval is in milliseconds.
+    """
+
+    timeout = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._interval_ = 0
+        self._singleShot_ = False
+        self._handle_ = None
+
+    def interval(self):
+        return self._interval_
+
+    def setInterval(self, interval):
+        self._interval_ = interval
+        if self._handle_ is not None:
+            self.start()
+
+    def setSingleShot(self, singleShot):
+        self._singleShot_ = singleShot
+
+    def isActive(self):
+        return self._handle_ is not None
+
+    def start(self, interval=None):
+        if interval is not None:
+            self._interval_ = interval
+        if self._handle_ is not None:
+            self._handle_.cancel()
+        self._handle_ = scheduler().callLater(self._interval_ / 1000, self._timeout_)
+
+    def stop(self):
+        if self._handle_ is not None:
+            self._handle_.cancel()
+            self._handle_ = None
+
+    def _timeout_(self):
+        if trace.active:
+            trace.instant("timeout", "timer", {"interval": self._interval_})
+        if self._singleShot_:
+            self._handle_ = None
+        else:
+            self._handle_ = scheduler().callLater(self._interval_ / 1000, self._timeout_)
+        self.timeout.emit()
+
+    @staticmethod
+    def singleShot(interval, callback):
+        scheduler().callLater(interval / 1000, callback)
+
+
+class Event(object):
+    r"""Replaces the QStateMachine.SignalEvent passed to onEntry/onExit."""
+
+    def __init__(self, arguments=()):
+        self._arguments_ = list(arguments)
+
+    def arguments(self):
+        return self._arguments_
+
+
+class State(Object):
+    r"""
+
+        Replaces QState: a state of a hierarchical state machine with either
+        exclusive (one active child) or parallel (all children active) children.
+
+        Parameters
+        ----------
+        childMode \: int
+            State.ExclusiveStates (default) or State.ParallelStates
+        parent \: State
+    """
+
+    ExclusiveStates = 0
+    ParallelStates = 1
+
+    entered = Signal()
+    exited = Signal()
+
+    def __init__(self, *args):
+        childMode, parent = State.ExclusiveStates, None
+        if args and isinstance(args[0], int):
+            childMode, args = args[0], args[1:]
+        if args:
+            parent = args[0]
+        super().__init__(parent)
+        self._childMode_ = childMode
+        self._children_ = []
+        self._initial_ = None
+        self._transitions_ = []
+        if parent is not None:
+            parent._children_.append(self)
+
+    def childMode(self):
+        return self._childMode_
+
+    def children(self):
+        return list(self._children_)
+
+    def setInitialState(self, state):
+        self._initial_ = state
+
+    def initialState(self):
+        return self._initial_
+
+    def machine(self):
+        state = self
+        while state is not None and not isinstance(state, StateMachine):
+            state = state.parent()
+        return state
+
+    def addTransition(self, signal, target):
+        r"""Makes the signal move the machine from this state to the target."""
+        def trigger(*args):
+            machine = self.machine()
+            if machine is not None:
+                machine._post_(self, target, args)
+        self._transitions_.append((signal, target, trigger))
+        signal.connect(trigger)
+
+    def onEntry(self, event):
+        pass
+
+    def onExit(self, event):
+        pass
+
+    def _ancestors_(self):
+        r"""Returns the proper ancestors from the parent upwards."""
+        ancestors = []
+        state = self.parent()
+        while isinstance(state, State):
+            ancestors.append(state)
+            state = state.parent()
+        return ancestors
+
+
+class StateMachine(State):
+    r"""
+
+        Replaces QStateMachine. Transitions are queued on the loop and handled
+        one at a time.
+    """
+
+    started = Signal()
+    stopped = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._active_ = set()
+        self._running_ = False
+
+    def addState(self, state):
+        if state.parent() is not None and state in state.parent()._children_:
+            state.parent()._children_.remove(state)
+        state.setParent(self)
+        self._children_.append(state)
+
+    def configuration(self):
+        return set(self._active_)
+
+    def isRunning(self):
+        return self._running_
+
+    def start(self):
+        def enter():
+            self._running_ = True
+            self.started.emit()
+            self._enterDefault_(self, Event())
+        scheduler().callLater(0, enter)
+
+    def stop(self):
+        self._exit_(self, Event())
+        self._running_ = False
+        self.stopped.emit()
+
+    def _post_(self, source, target, args):
+        scheduler().callLater(0, lambda: self._transition_(source, target, args))
+
+    def _transition_(self, source, target, args):
+        if not self._running_ or source not in self._active_:
+            return
+        logger.debug(f"Transition from {source.objectName() or source} to {target.objectName() or target}.")
+        event = Event(args)
+        targetAncestors = target._ancestors_()
+        domain = next((s for s in source._ancestors_() if s in targetAncestors), self)
+        self._exit_(domain, event)
+
+        path = targetAncestors[:targetAncestors.index(domain)][::-1] + [target]
+        for i, iState in enumerate(path):
+            self._enter_(iState, event)
+            if iState.childMode() == State.ParallelStates and iState is not target:
+                # enter the other regions of the parallel state
+                following = path[i + 1]
+                for iChild in iState.children():
+                    if iChild is not following:
+                        self._enter_(iChild, event)
+                        self._enterDefault_(iChild, event)
+        self._enterDefault_(target, event)
+
+    def _enter_(self, state, event):
+        self._active_.add(state)
+        state.onEntry(event)
+        state.entered.emit()
+
+    def _enterDefault_(self, state, event):
+        r"""Enters the initial (or with parallel states all) descendants."""
+        if not state.children():
+            return
+        if state.childMode() == State.ParallelStates:
+            children = state.children()
+        elif state.initialState() is not None:
+            children = [state.initialState()]
+        else:
+            raise RuntimeError(f"State {state.objectName() or state} has children but no initial state.")
+        for iChild in children:
+            self._enter_(iChild, event)
+            self._enterDefault_(iChild, event)
+
+    def _exit_(self, domain, event):
+        r"""Exits all active descendants of the domain, deepest first."""
+        leaving = [s for s in self._active_ if domain in s._ancestors_()]
+        leaving.sort(key=lambda s: len(s._ancestors_()), reverse=True)
+        for iState in leaving:
+            self._active_.discard(iState)
+            iState.onExit(event)
+            iState.exited.emit()
+
+
+class Application(object):
+    r"""
+
+        Replaces QApplication: runs the event loop until quit is called.
+
+        Parameters
+        ----------
+        argv \: list
+            not used
+    """
+
+    def __init__(self, argv=None):
+        self.argv = argv if argv is not None else sys.argv
+        self._loop_ = loop()
+
+    def exec_(self):
+        try:
+            self._loop_.run_forever()
+        finally:
+            self._loop_.run_until_complete(self._loop_.shutdown_asyncgens())
+        return 0
+
+    exec = exec_
+
+    def quit(self):
+        self._loop_.stop()
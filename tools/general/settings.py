@@ -0,0 +1,99 @@
+r"""
+The settings of the checkers and their validation.
+
+Kept apart from tools.general.checker so that configurations can be validated
+without importing the event loop backend or NumPy (see tools.validate).
+"""
+
+from numbers import Number
+
+from tools.general import filters
+from tools.general.history import SummaryPyramid
+
+DEFAULTS = {"lowlimit": -float('inf'),
+            "highlimit": float('inf'),
+            "der": 0,
+            "acc": 0,
+            "window": 1,
+            "interval": 1000,
+            "filter": None,
+            "horizon": None,
+            "aggregate": "mean",
+            "adaptive": False,
+            "mininterval": 100,
+            "maxinterval": 60000,
+            "margin": None,
+            "critical": False,
+            "tag": None
+            }
+
+
+def _number_(value):
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def _count_(value, least):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= least
+
+
+def check(settings):
+    r"""Validates the settings of a checker.
+
+    Parameters
+    ----------
+    settings \: dict
+        see GeneralChecker
+
+    Returns
+    -------
+    list of str
+        the problems found, empty when the settings are valid
+    """
+    if not isinstance(settings, dict):
+        return [f"The settings should be a dict, not {type(settings).__name__}."]
+    errors = []
+    par = dict(DEFAULTS)
+    par.update({k: v for k, v in settings.items() if k in DEFAULTS})
+
+    for iKey in ("lowlimit", "highlimit"):
+        if not _number_(par[iKey]):
+            errors.append(f"{iKey} should be a number, not {par[iKey]!r}.")
+    for iKey, least in (("der", 0), ("acc", 0), ("window", 1)):
+        if not _count_(par[iKey], least):
+            errors.append(f"{iKey} should be an integer of at least {least}, not {par[iKey]!r}.")
+    for iKey in ("interval", "mininterval", "maxinterval"):
+        if not _number_(par[iKey]) or par[iKey] <= 0:
+            errors.append(f"{iKey} should be a positive number of miliseconds, not {par[iKey]!r}.")
+    if par["margin"] is not None and (not _number_(par["margin"]) or par["margin"] <= 0):
+        errors.append(f"margin should be a positive number, not {par['margin']!r}.")
+    if par["horizon"] is not None and (not _number_(par["horizon"]) or par["horizon"] <= 0):
+        errors.append(f"horizon should be a positive number of seconds, not {par['horizon']!r}.")
+    for iKey in ("adaptive", "critical"):
+        if not isinstance(par[iKey], bool):
+            errors.append(f"{iKey} should be true or false, not {par[iKey]!r}.")
+    if par["tag"] is not None and not isinstance(par["tag"], str):
+        errors.append(f"tag should be a string, not {par['tag']!r}.")
+    if par["aggregate"] not in SummaryPyramid.aggregates:
+        errors.append(f"Unknown aggregate {par['aggregate']!r}. Choose from {SummaryPyramid.aggregates}.")
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        errors.append(f"Unknown settings {sorted(unknown)}.")
+    if len(errors) > bool(unknown):
+        # the remaining checks need valid types
+        return errors
+
+    if par["lowlimit"] >= par["highlimit"]:
+        errors.append(f"lowlimit {par['lowlimit']} is not below highlimit {par['highlimit']}.")
+    if par["horizon"] is not None and par["tag"] is None:
+        errors.append("horizon needs a tag, whose history is kept by the acquisition.")
+    if par["mininterval"] > par["maxinterval"]:
+        errors.append(f"mininterval {par['mininterval']} is above maxinterval {par['maxinterval']}.")
+    kind = par["filter"] or filters.default(par["der"])
+    if kind not in filters.KINDS:
+        errors.append(f"Unknown filter {kind!r}. Choose from {filters.KINDS}.")
+    else:
+        try:
+            filters.check(kind, par["der"], filters.window(kind, par["der"], par["acc"]))
+        except ValueError as E:
+            errors.append(str(E))
+    return errors
@@ -0,0 +1,372 @@
+r"""
+Read-only HTTP API serving the state of a running control process from memory.
+
+Dashboards and scripts (like the loops example in controlsystem.py) can read
+the latest data from here instead of building their own ControlSystemMap, so
+the cRIO is polled once by the acquisition however many clients connect.
+Everything is captured on the thread of the event loop whenever the
+acquisition has new data; the requests are answered from that copy. Only the
+histories are queried by the requests, holding the lock of the history store.
+
+    GET /snapshot                         the latest value of every tag
+    GET /kpis                             the derived KPIs, by default the
+                                          flow, dT and power of LOOPS
+    GET /checkers                         checker and condition statuses by unit
+    GET /state                            the active states by unit
+    GET /history?tag=TICA-101&aggregate=mean&horizon=600[&step=60]
+                                          an aggregate of the history of a tag,
+                                          or a series of them every step seconds
+    GET /stream                           server-sent events: the complete
+                                          snapshot, then only what changed,
+                                          with ids "<epoch>-<version>"
+
+Every response carries an ETag; a request with a matching If-None-Match is
+answered with 304 Not Modified.
+
+Example of usage:
+    server = SnapshotServer(acquisition, port=8100)
+    server.addUnit("TCS", tcs.checkers, TCSstate)
+    server.start()
+and then e.g. curl http://localhost:8100/snapshot
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from numbers import Number
+from urllib.parse import parse_qs, urlsplit
+
+from tools.general.backend import clock
+
+import logging
+logger = logging.getLogger(__name__)
+
+# the heat transfer loops of the demonstrator, as in the example of controlsystem.py
+LOOPS = {"Solar": {"Flow": "FI-532", "T_in": "TI-521a", "T_out": "TI-521b"},
+         "HX": {"Flow": "FICSA-031", "T_in": "TI-021a", "T_out": "TI-021b"},
+         "Boiler": {"Flow": "FICSA-031", "T_in": "TI-022a", "T_out": "TI-022b"},
+         "TCS_Hot": {"Flow": "FICSA-131", "T_in": "TIA-121a", "T_out": "TIA-121b"},
+         "TCS_Cold": {"Flow": "FI-532", "T_in": "TI-221a", "T_out": "TISA-221b"},
+         "Shower": {"Flow": "FI-431", "T_in": "TI-421a", "T_out": "TI-422b"}}
+
+
+def loopKPIs(loops=LOOPS, attribute=".PV"):
+    r"""Returns the flow, temperature difference and power of every loop.
+
+    Parameters
+    ----------
+    loops \: dict
+        the name of every loop and the tags of its flow, inlet and outlet
+        temperature
+    attribute \: str
+        appended to the tags, the data carries the attributes of the tags
+        (e.g. "FI-532.PV") like Attribute.get_Value in controlsystem.py
+
+    Returns
+    -------
+    dict
+        name of the KPI and function of the latest values
+    """
+    kpis = {}
+    for iLoop, iTags in loops.items():
+        iSensors = {iName: f"{iTag}{attribute}" for iName, iTag in iTags.items()}
+        kpis[f"{iLoop}.Flow"] = partial(lambda x, s: x[s["Flow"]], s=iSensors)
+        kpis[f"{iLoop}.dT"] = partial(lambda x, s: x[s["T_out"]] - x[s["T_in"]], s=iSensors)
+        kpis[f"{iLoop}.Power"] = partial(lambda x, s: x[s["Flow"]] * (x[s["T_out"]] - x[s["T_in"]]) * 4200 / 3600,
+                                         s=iSensors)
+    return kpis
+
+
+def _jsonable_(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, Number):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    return str(value)
+
+
+def _encode_(body):
+    return json.dumps(body, separators=(",", ":")).encode()
+
+
+class SnapshotServer(object):
+    r"""
+
+        Serves the latest data, KPIs, histories, checker statuses and states of
+        a process, see the module documentation.
+
+        Parameters
+        ----------
+        acquisition \: Acquisition
+            the shared acquisition of the process
+        kpis \: dict
+            name of the KPI and function of the latest values (a dict of tag
+            and value), by default loopKPIs()
+        host \: str
+        port \: int
+            0 picks a free port
+        changes \: int
+            the number of changes kept for streaming clients that fell behind
+    """
+
+    resources = ("snapshot", "kpis", "checkers", "state")
+
+    def __init__(self, acquisition, kpis=None, host="localhost", port=8100, changes=64):
+        self.acquisition = acquisition
+        self.kpis = kpis if kpis is not None else loopKPIs()
+        self.units = {}
+        self.version = 0
+        # the time of the data the history is read up to
+        self.dataTime = None
+        # distinguishes the versions (event ids and ETags) of a restarted process
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self._current_ = {iName: {} for iName in SnapshotServer.resources}
+        self._bodies_ = {iName: (f'"{self.epoch}-{iName}-0"', _encode_({})) for iName in SnapshotServer.resources}
+        self._changes_ = deque(maxlen=changes)
+        self._condition_ = threading.Condition()
+        self._closed_ = False
+        self._thread_ = None
+        self._server_ = ThreadingHTTPServer((host, port), handler(self))
+        self._server_.daemon_threads = True
+        acquisition.updated.connect(self.update)
+
+    @property
+    def closed(self):
+        return self._closed_
+
+    @property
+    def address(self):
+        host, port = self._server_.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def addUnit(self, name, checkers=None, stateMashina=None):
+        r"""Adds the checker statuses and the states of a unit.
+
+        Parameters
+        ----------
+        name \: str
+        checkers \: CheckerMaster
+        stateMashina \: QStateMachine
+        """
+        self.units[name] = (checkers, stateMashina)
+
+    def start(self):
+        logger.info(f"Serving the snapshot at {self.address}.")
+        self._thread_ = threading.Thread(target=self._server_.serve_forever, name="snapshot", daemon=True)
+        self._thread_.start()
+
+    def stop(self):
+        with self._condition_:
+            self._closed_ = True
+            self._condition_.notify_all()
+        if self._thread_ is not None:
+            # shutdown waits for serve_forever, i.e. forever when not started
+            self._server_.shutdown()
+            self._thread_.join()
+            self._thread_ = None
+        self._server_.server_close()
+        self.acquisition.updated.disconnect(self.update)
+        logger.info("Snapshot server stopped.")
+
+    def _capture_(self):
+        data = self.acquisition.data
+        values = {}
+        if data is not None and len(data):
+            values = {str(iTag): _jsonable_(iValue) for iTag, iValue in data.iloc[-1].items()}
+        kpis = {}
+        for iName, iFunc in self.kpis.items():
+            try:
+                kpis[iName] = _jsonable_(iFunc(values))
+            except (KeyError, TypeError, ZeroDivisionError):
+                kpis[iName] = None
+        checkers, state = {}, {}
+        for iUnit, (iCheckers, iStateMashina) in self.units.items():
+            if iCheckers is not None:
+                checkers[iUnit] = {"checkers": iCheckers.statusCheckers,
+                                   "conditions": {iName: iCondition.status
+                                                  for iName, iCondition in iCheckers.conditions.items()}}
+            if iStateMashina is not None:
+                state[iUnit] = sorted(iState.objectName() for iState in iStateMashina.configuration())
+        return {"snapshot": values, "kpis": kpis, "checkers": checkers, "state": state}
+
+    def update(self):
+        r"""Captures the process after every poll of the acquisition.
+
+        Runs on the thread of the event loop, so the checkers and state
+        machines are not read while they change. The version only changes
+        when the content does.
+        """
+        captured = self._capture_()
+        with self._condition_:
+            self.dataTime = self.acquisition.dataTime
+        change = {}
+        for iName, iContent in captured.items():
+            if iContent == self._current_[iName]:
+                continue
+            if iName in ("snapshot", "kpis"):
+                previous = self._current_[iName]
+                change[iName] = {k: v for k, v in iContent.items() if k not in previous or previous[k] != v}
+            else:
+                change[iName] = iContent
+        if not change:
+            # the same content keeps its version, so the ETags stay valid and no event is streamed
+            return
+        with self._condition_:
+            self.version += 1
+            for iName in change:
+                self._current_[iName] = captured[iName]
+                self._bodies_[iName] = (f'"{self.epoch}-{iName}-{self.version}"', _encode_(captured[iName]))
+            change["time"] = self.dataTime
+            self._changes_.append((self.version, _encode_(change)))
+            self._condition_.notify_all()
+
+    def body(self, name):
+        r"""Returns the ETag and the encoded content of a resource."""
+        with self._condition_:
+            return self._bodies_[name]
+
+    def full(self):
+        r"""Returns the version and the encoded content of all resources."""
+        with self._condition_:
+            content = {iName: self._current_[iName] for iName in SnapshotServer.resources}
+            content["time"] = self.dataTime
+            return self.version, _encode_(content)
+
+    def history(self, tag, aggregate, horizon, step=None):
+        r"""Queries the history store of the acquisition.
+
+        Parameters
+        ----------
+        tag \: str
+        aggregate \: str
+            see SummaryPyramid.query
+        horizon \: float
+            seconds
+        step \: float
+            returns a series of the aggregate over every step within the horizon
+
+        Returns
+        -------
+        dict
+        """
+        store = self.acquisition.history
+        with self._condition_:
+            now = self.dataTime if self.dataTime is not None else clock()
+        # the acquisition appends on the thread of the event loop, the lock keeps it out while reading
+        with store.lock:
+            if tag not in store:
+                raise KeyError(f"No history of {tag}.")
+            if not step:
+                return {"tag": tag, "aggregate": aggregate, "horizon": horizon,
+                        "value": _jsonable_(store.query(tag, aggregate, horizon, now))}
+            points = min(int(horizon // step), 1000)
+            return {"tag": tag, "aggregate": aggregate, "horizon": horizon, "step": step,
+                    "time": [now - i * step for i in range(points - 1, -1, -1)],
+                    "value": [_jsonable_(store.query(tag, aggregate, step, now - i * step))
+                              for i in range(points - 1, -1, -1)]}
+
+    def changes(self, since, timeout):
+        r"""Waits for the changes after a version.
+
+        Returns
+        -------
+        list of (int, bytes) or None
+            None when the changes after since are no longer kept or since is
+            not a version of this process
+        """
+        with self._condition_:
+            if since > self.version:
+                return None
+            if self.version <= since and not self._closed_:
+                self._condition_.wait(timeout)
+            if self._closed_:
+                return []
+            if self._changes_ and self._changes_[0][0] > since + 1:
+                return None
+            return [iChange for iChange in self._changes_ if iChange[0] > since]
+
+
+def handler(server, keepalive=15.):
+    r"""Creates the request handler reading from the snapshot server."""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send_(self, status, body=b"", etag=None):
+            if etag is not None and etag in self.headers.get("If-None-Match", ""):
+                status, body = 304, b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache")
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            route = url.path.strip("/")
+            if route in SnapshotServer.resources:
+                etag, body = server.body(route)
+                return self._send_(200, body, etag)
+            if route == "history":
+                return self._history_(parse_qs(url.query))
+            if route == "stream":
+                return self._stream_()
+            self._send_(404, _encode_({"Error": f"Unknown route {url.path}"}))
+
+        def _history_(self, query):
+            try:
+                tag = query["tag"][0]
+                aggregate = query.get("aggregate", ["mean"])[0]
+                horizon = float(query.get("horizon", [60])[0])
+                step = float(query["step"][0]) if "step" in query else None
+                # the history only changes with the data of the acquisition
+                etag = f'"{server.epoch}-history-{server.dataTime}"'
+                body = _encode_(server.history(tag, aggregate, horizon, step))
+            except KeyError as E:
+                return self._send_(404, _encode_({"Error": E.args[0]}))
+            except ValueError as E:
+                return self._send_(400, _encode_({"Error": str(E)}))
+            self._send_(200, body, etag)
+
+        def _event_(self, name, version, body):
+            self.wfile.write(b"event: %s\nid: %s-%d\ndata: %s\n\n"
+                             % (name.encode(), server.epoch.encode(), version, body))
+            self.wfile.flush()
+
+        def _stream_(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            # the ids of another process (before a restart) start over
+            epoch, _, version = self.headers.get("Last-Event-ID", "").rpartition("-")
+            since = int(version) if epoch == server.epoch and version.isdigit() else -1
+            try:
+                changes = server.changes(since, 0) if since >= 0 else None
+                while not server.closed:
+                    if changes is None:
+                        # new or fell behind, start over from the complete snapshot
+                        since, body = server.full()
+                        self._event_("snapshot", since, body)
+                    elif not changes:
+                        self.wfile.write(b": keep-alive\n\n")
+                        self.wfile.flush()
+                    for version, body in changes or ():
+                        self._event_("change", version, body)
+                        since = version
+                    changes = server.changes(since, keepalive)
+            except (BrokenPipeError, ConnectionResetError):
+                logger.debug("Stream client disconnected.")
+
+    return Handler
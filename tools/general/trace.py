@@ -0,0 +1,141 @@
+r"""
+Low-overhead event trace recorder.
+
+Records timer fires, data fetches, checker results, signal emissions and state
+entries/exits in a fixed-size ring buffer and writes them as a Chrome trace
+(chrome://tracing or https://ui.perfetto.dev), so the latency and ordering of
+a misbehaving charge cycle can be inspected on a timeline.
+
+The hooks in the package check the module attribute `active` before doing
+anything, so a disabled recorder costs one attribute lookup:
+    if trace.active:
+        trace.begin("run", "checker", name)
+
+Recording is started with enable(), or when the package is imported with the
+environment variable CCO_TRACE set to the file the trace is written to on
+error and at exit.
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import logging
+logger = logging.getLogger(__name__)
+
+active = False
+_buffer_ = deque(maxlen=1)
+_errorPath_ = None
+_excepthook_ = None
+
+
+def enable(size=100000, errorPath=None):
+    r"""Starts recording.
+
+    Parameters
+    ----------
+    size \: int
+        the number of events kept, older ones are dropped
+    errorPath \: str
+        when given, the trace is written to this file on an unhandled
+        exception, when error() is called and at exit
+    """
+    global active, _buffer_, _errorPath_, _excepthook_
+    logger.info(f"Recording trace of the last {size} events.")
+    _buffer_ = deque(maxlen=size)
+    _errorPath_ = errorPath
+    if errorPath and _excepthook_ is None:
+        _excepthook_ = sys.excepthook
+        sys.excepthook = _onException_
+        atexit.register(_atExit_)
+    active = True
+
+
+def disable():
+    global active
+    active = False
+
+
+def _record_(ph, name, cat, args, key=None):
+    _buffer_.append((ph, name, cat, time.perf_counter_ns(), threading.get_ident(), args, key))
+
+
+def begin(name, cat, args=None):
+    r"""Marks the start of a span, ended by end() with the same name."""
+    _record_("B", name, cat, args)
+
+
+def end(name, cat, args=None):
+    _record_("E", name, cat, args)
+
+
+def instant(name, cat, args=None):
+    r"""Marks a moment, e.g. a signal emission."""
+    _record_("i", name, cat, args)
+
+
+def enter(name, cat="state"):
+    r"""Marks entering a state, shown as a span until leave()."""
+    _record_("b", name, cat, None, name)
+
+
+def leave(name, cat="state"):
+    _record_("e", name, cat, None, name)
+
+
+def events():
+    r"""Returns the recorded events in the Chrome trace event format."""
+    pid = os.getpid()
+    out = []
+    for ph, name, cat, ns, tid, args, key in list(_buffer_):
+        event = {"name": name, "cat": cat, "ph": ph, "ts": ns / 1000, "pid": pid, "tid": tid}
+        if args:
+            event["args"] = args if isinstance(args, dict) else {"value": str(args)}
+        if ph == "i":
+            event["s"] = "t"
+        if key is not None:
+            event["id"] = key
+        out.append(event)
+    return out
+
+
+def dump(path):
+    r"""Writes the recorded events as a Chrome trace / Perfetto JSON file.
+
+    Parameters
+    ----------
+    path \: str
+    """
+    logger.info(f"Writing trace to {path}.")
+    # written next to the file and renamed, so an earlier trace is never left half written
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, mode="w") as file:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, file, default=str)
+    os.replace(temporary, path)
+
+
+def error(reason=""):
+    r"""Records an error and writes the trace when an error path is set."""
+    if not active:
+        return
+    instant("error", "error", reason or None)
+    if _errorPath_:
+        dump(_errorPath_)
+
+
+def _onException_(kind, value, traceback):
+    error(f"{kind.__name__}: {value}")
+    _excepthook_(kind, value, traceback)
+
+
+def _atExit_():
+    if active and _errorPath_:
+        dump(_errorPath_)
+
+
+if os.environ.get("CCO_TRACE"):
+    enable(errorPath=os.environ["CCO_TRACE"])
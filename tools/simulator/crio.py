@@ -0,0 +1,254 @@
+r"""
+Local stand-in for the HTTP interface of the cRIO web service.
+
+Serves a system information schema with a configurable number of tags,
+process values synthesized from simple plant models and accepts setpoints that
+feed back into those models. Latency, jitter and errors can be injected, so
+that the acquisition, the startup (building ControlSystemMap) and the writing
+of setpoints can be load-tested at production scale without a cRIO.
+
+The routes mirror the methods of cRIOWebServerComms used in this package,
+relative to the base URL passed as its ip:
+    GET  <base>getSystemInformation  -> {"Tag Information": {group: {tag: {attribute: properties}}}}
+    GET  <base>getCurrentData        -> {"Data": {attribute: value}, "Units": {attribute: unit}}
+    POST <base>setSetpoint           <- {"Tag": attribute, "Value": value} (or a list of them)
+
+Usage:
+    python -m tools.simulator.crio --tags 5000 --port 8002 --latency 0.02 --jitter 0.01 --errors 0.001
+and then e.g. ControlSystemMap(ip='http://localhost:8002/cRIO-Webservice/') or
+Acquisition(source=acquisition.webService('http://localhost:8002/cRIO-Webservice/')).
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+# tags used by the mashinas. The data is keyed by attribute ("TICA-101.PV"), the
+# acquisition source tools.general.acquisition.webService adds the bare tags
+# ("TICA-101") the TCS mashina reads.
+KNOWN = {"Process Values": {"TICA-101": "degC", "TICA-102": "degC", "P-101": "m3/h", "FICA-111": "m3/h",
+                            "FICA-131": "m3/h", "FI-532": "m3/h"}}
+
+
+class Plant(object):
+    r"""
+
+        Plant-like models of all process values.
+
+        Every controller has a setpoint (SP) and a process value (PV) following
+        it as a first-order lag. Every other process value drifts around its
+        own operating point with a slow oscillation, a random walk and
+        measurement noise. The models are advanced lazily, whenever the values
+        are requested.
+
+        Parameters
+        ----------
+        tags \: int
+            the total number of tags (process values and controllers)
+        controllers \: float
+            the fraction of the tags that are controllers
+        seed \: int
+    """
+
+    def __init__(self, tags=100, controllers=0.1, seed=0):
+        self._rng_ = np.random.default_rng(seed)
+        self._lock_ = threading.Lock()
+        nControllers = max(1, int(tags * controllers))
+        known = [(iTag, iUnit) for iGroup in KNOWN.values() for iTag, iUnit in iGroup.items()]
+        nValues = max(0, tags - nControllers - len(known))
+
+        self.processValues = [iTag for iTag, _ in known] + [f"TI-{i:05d}" for i in range(nValues)]
+        self.controllers = [f"TICSA-{i:05d}" for i in range(nControllers)]
+        self.units = {f"{iTag}.PV": iUnit for iTag, iUnit in known}
+        self.units.update({f"{iTag}.PV": "degC" for iTag in self.processValues[len(known):]})
+        self.units.update({f"{iTag}.{iAttribute}": "degC" for iTag in self.controllers for iAttribute in ("SP", "PV")})
+
+        # one row per modelled value: the process values and then the controllers
+        self.attributes = [f"{iTag}.PV" for iTag in self.processValues] + [f"{iTag}.PV" for iTag in self.controllers]
+        n = len(self.attributes)
+        self.base = self._rng_.uniform(20, 80, n)
+        self.value = self.base.copy()
+        self.tau = self._rng_.uniform(10, 120, n)
+        self.period = self._rng_.uniform(300, 3600, n)
+        self.phase = self._rng_.uniform(0, 2 * np.pi, n)
+        self.noise = self._rng_.uniform(0.01, 0.2, n)
+        self.controlled = np.zeros(n, dtype=bool)
+        self.controlled[len(self.processValues):] = True
+        self.setpoint = self.base.copy()
+        self._index_ = {iAttribute: i for i, iAttribute in enumerate(self.attributes)}
+        self._start_ = self._time_ = time.monotonic()
+
+    def schema(self):
+        r"""Returns the system information as served by the cRIO."""
+        information = {"Process Values": {}, "Controllers": {}}
+        for iTag in self.processValues:
+            information["Process Values"][iTag] = {f"{iTag}.PV": {"Unit": self.units[f"{iTag}.PV"],
+                                                                  "Settable": False}}
+        for iTag in self.controllers:
+            information["Controllers"][iTag] = {
+                f"{iTag}.PV": {"Unit": "degC", "Settable": False},
+                f"{iTag}.SP": {"Unit": "degC", "Settable": True, "Range.Min": 0, "Range.Max": 150},
+                f"{iTag}.Auto": {"Settable": True}}
+        return {"Tag Information": information}
+
+    def advance(self):
+        r"""Advances all models to the current time."""
+        now = time.monotonic()
+        dt = now - self._time_
+        if dt <= 0:
+            return
+        self._time_ = now
+        t = now - self._start_
+        target = np.where(self.controlled, self.setpoint,
+                          self.base + 5 * np.sin(2 * np.pi * t / self.period + self.phase))
+        # exact discretization of the first-order lag
+        self.value += (target - self.value) * (1 - np.exp(-dt / self.tau))
+        self.base += self._rng_.normal(0, 0.01 * np.sqrt(dt), len(self.base))
+
+    def data(self):
+        r"""Returns the current values of all attributes."""
+        with self._lock_:
+            self.advance()
+            measured = self.value + self._rng_.normal(0, 1, len(self.value)) * self.noise
+            data = dict(zip(self.attributes, measured.tolist()))
+            for iTag, iIndex in zip(self.controllers, range(len(self.processValues), len(self.attributes))):
+                data[f"{iTag}.SP"] = float(self.setpoint[iIndex])
+                data[f"{iTag}.Auto"] = True
+        return data
+
+    def set(self, attribute, value):
+        r"""Writes a setpoint, the process value of the controller follows it."""
+        tag, _, name = attribute.rpartition(".")
+        if tag not in self.controllers or name not in ("SP", "Auto"):
+            raise KeyError(f"{attribute} is not settable.")
+        if name == "SP":
+            with self._lock_:
+                self.advance()
+                self.setpoint[self._index_[f"{tag}.PV"]] = float(value)
+
+
+class Faults(object):
+    r"""
+
+        The latency, jitter and errors injected into every request.
+
+        Parameters
+        ----------
+        latency \: float
+            seconds added to every response
+        jitter \: float
+            the standard deviation of a random extra latency in seconds
+        errors \: float
+            the probability of answering with an internal server error
+    """
+
+    def __init__(self, latency=0., jitter=0., errors=0.):
+        self.latency = latency
+        self.jitter = jitter
+        self.errors = errors
+
+    def apply(self):
+        r"""Sleeps and returns whether the request should fail."""
+        delay = self.latency + abs(random.gauss(0, self.jitter)) if self.jitter else self.latency
+        if delay > 0:
+            time.sleep(delay)
+        return random.random() < self.errors
+
+
+def handler(plant, faults, base="/cRIO-Webservice/"):
+    r"""Creates the request handler serving the plant."""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _route_(self):
+            path = self.path.split("?")[0]
+            return path[len(base):] if path.startswith(base) else None
+
+        def _send_(self, status, body=None):
+            payload = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            route = self._route_()
+            if faults.apply():
+                return self._send_(500, {"Error": "Injected error"})
+            if route == "getSystemInformation":
+                self._send_(200, plant.schema())
+            elif route == "getCurrentData":
+                self._send_(200, {"Data": plant.data(), "Units": plant.units})
+            else:
+                self._send_(404, {"Error": f"Unknown route {self.path}"})
+
+        def do_POST(self):
+            route = self._route_()
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"null")
+            if faults.apply():
+                return self._send_(500, {"Error": "Injected error"})
+            if route != "setSetpoint":
+                return self._send_(404, {"Error": f"Unknown route {self.path}"})
+            setpoints = body if isinstance(body, list) else [body]
+            try:
+                for iSetpoint in setpoints:
+                    plant.set(iSetpoint["Tag"], iSetpoint["Value"])
+            except (KeyError, TypeError, ValueError) as E:
+                return self._send_(400, {"Error": str(E)})
+            self._send_(200, {"Written": len(setpoints)})
+
+    return Handler
+
+
+def serve(plant, faults=None, host="localhost", port=8002):
+    r"""Creates the simulator server, call serve_forever() to run it.
+
+    Returns
+    -------
+    ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), handler(plant, faults or Faults()))
+    server.daemon_threads = True
+    logger.info(f"Simulating {len(plant.processValues) + len(plant.controllers)} tags at "
+                f"http://{host}:{server.server_address[1]}/cRIO-Webservice/")
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulates the cRIO web service.")
+    parser.add_argument("--tags", type=int, default=100, help="the number of tags (100 to 50000)")
+    parser.add_argument("--controllers", type=float, default=0.1, help="the fraction of tags that are controllers")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0., help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0., help="standard deviation of extra latency in seconds")
+    parser.add_argument("--errors", type=float, default=0., help="probability of an error response")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    plant = Plant(args.tags, args.controllers, args.seed)
+    server = serve(plant, Faults(args.latency, args.jitter, args.errors), args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,171 @@
+r"""
+Load generator for the cRIO web service (or its simulator, tools.simulator.crio).
+
+Runs a number of concurrent clients requesting the current data for a while,
+optionally writing setpoints in batches, and prints the throughput and the
+latency percentiles. With --acquisition the clients read through the source
+of the acquisition (tools.general.acquisition.webService) instead, i.e.
+including building the data frame the checkers use. With --startup it also
+times reading the system information, i.e. the startup of ControlSystemMap.
+
+Usage:
+    python -m tools.simulator.load --url http://localhost:8002/cRIO-Webservice/ --clients 8 --duration 30
+    python -m tools.simulator.load --simulate 20000 --clients 4 --writes 10 --batch 50
+"""
+
+import argparse
+import json
+import threading
+from functools import partial
+import time
+import urllib.error
+import urllib.request
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def request(url, body=None, timeout=30):
+    r"""Sends a request and returns the decoded JSON response."""
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if data is not None else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class Statistics(object):
+    r"""Collects the latencies and errors of one kind of request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self._lock_ = threading.Lock()
+
+    def timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except (urllib.error.URLError, OSError, ValueError) as E:
+            logger.debug(f"{self.name} failed: {E}")
+            with self._lock_:
+                self.errors += 1
+            return None
+        with self._lock_:
+            self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def percentile(self, p):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else float('nan')
+
+    def report(self, duration):
+        n = len(self.latencies)
+        return (f"{self.name:>12} {n:>8} {n / duration:>10.1f} {self.errors:>7} "
+                f"{1000 * self.percentile(50):>8.1f} {1000 * self.percentile(95):>8.1f} "
+                f"{1000 * self.percentile(99):>8.1f}")
+
+
+def run(url, clients=4, duration=10., writes=0., batch=1, acquisition=False):
+    r"""Generates load and returns the statistics.
+
+    Parameters
+    ----------
+    url \: str
+        the base URL of the web service
+    clients \: int
+        the number of concurrent clients requesting the current data
+    duration \: float
+        seconds
+    writes \: float
+        the number of setpoint batches written per second
+    batch \: int
+        the number of setpoints per batch
+    acquisition \: bool
+        read through the source of the acquisition instead of plain requests
+
+    Returns
+    -------
+    list of Statistics
+    """
+    reads, written = Statistics("acquisition" if acquisition else "getCurrentData"), Statistics("setSetpoint")
+    settable = []
+    if writes:
+        information = request(url + "getSystemInformation")["Tag Information"]
+        settable = [iAttribute for iGroup in information.values() for iTag in iGroup.values()
+                    for iAttribute, iProperties in iTag.items()
+                    if iProperties.get("Settable") and "Range.Max" in iProperties]
+    stop = time.monotonic() + duration
+
+    if acquisition:
+        from tools.general.acquisition import webService
+        read = webService(url)
+    else:
+        read = partial(request, url + "getCurrentData")
+
+    def reader():
+        while time.monotonic() < stop:
+            reads.timed(read)
+
+    def writer():
+        i = 0
+        while time.monotonic() < stop and settable:
+            setpoints = [{"Tag": settable[(i + j) % len(settable)], "Value": 20 + (i + j) % 60} for j in range(batch)]
+            written.timed(request, url + "setSetpoint", setpoints)
+            i += batch
+            time.sleep(1 / writes)
+
+    threads = [threading.Thread(target=reader) for _ in range(clients)]
+    if writes:
+        threads.append(threading.Thread(target=writer))
+    for iThread in threads:
+        iThread.start()
+    for iThread in threads:
+        iThread.join()
+    return [reads, written] if writes else [reads]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generates load on the cRIO web service.")
+    parser.add_argument("--url", default="http://localhost:8002/cRIO-Webservice/")
+    parser.add_argument("--simulate", type=int, default=0,
+                        help="start a local simulator with this number of tags instead of using --url")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.)
+    parser.add_argument("--writes", type=float, default=0., help="setpoint batches per second")
+    parser.add_argument("--batch", type=int, default=1, help="setpoints per batch")
+    parser.add_argument("--acquisition", action="store_true", help="read through the source of the acquisition")
+    parser.add_argument("--startup", action="store_true", help="also time building a ControlSystemMap")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.simulate:
+        from tools.simulator import crio
+        server = crio.serve(crio.Plant(args.simulate), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.url = f"http://localhost:{server.server_address[1]}/cRIO-Webservice/"
+
+    try:
+        start = time.perf_counter()
+        information = request(args.url + "getSystemInformation")
+        tags = sum(len(iGroup) for iGroup in information["Tag Information"].values())
+        print(f"getSystemInformation of {tags} tags: {1000 * (time.perf_counter() - start):.1f} ms")
+        if args.startup:
+            from tools.general.controlsystem import ControlSystemMap
+            start = time.perf_counter()
+            ControlSystemMap(ip=args.url)
+            print(f"ControlSystemMap startup: {1000 * (time.perf_counter() - start):.1f} ms")
+
+        statistics = run(args.url, args.clients, args.duration, args.writes, args.batch, args.acquisition)
+        print(f"{'request':>12} {'n':>8} {'per s':>10} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for iStatistics in statistics:
+            print(iStatistics.report(args.duration))
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,226 @@
+r"""
+Soak test of the TCS control system over many simulated cycles.
+
+Runs the TCS mashina and its state machine (built from topology.json) on the
+headless runtime with a virtual clock, fed by a simulated plant, so hours of
+operation take seconds. Every cycle the plant warms up the storage until a
+charge starts, lets the A/D temperature become stable and then lets the flow
+drop during the preheat, which ends the charge with an error and brings the
+system back to Neutral. This creates and stops the checkers, timers and signal
+connections of Neutral, Charging AD Phase 1A and Charging AD Phase 1B once per
+cycle. The discharging states are not implemented yet and are therefore not
+part of the cycle.
+
+The soak test has its own configuration (tools/soak.json), which only differs
+from config.json in Phase 1B: its limit is above the stable temperature
+reported by Phase 1A, so the preheat is never skipped, and its goal is a
+temperature the plant does not reach before the flow error.
+
+After every cycle the resident memory, the memory traced by tracemalloc, the
+number of Python objects, the number of signal connections, the number of
+active timers and the duration of the handled timer callbacks are recorded.
+The test fails when any of them keeps growing after the warm-up cycles.
+
+Usage:
+    python -m tools.soak [--cycles 200] [--warmup 20] [--period 120] [--config tools/soak.json]
+"""
+
+import argparse
+import gc
+import os
+import resource
+import statistics
+import sys
+import tracemalloc
+
+import logging
+logger = logging.getLogger(__name__)
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soak.json")
+
+# growth tolerated between the first and last third of the cycles after warm-up
+TOLERANCES = {"rss": (0.10, 4 * 2 ** 20),
+              "traced": (0.05, 2 ** 20),
+              "objects": (0.02, 500),
+              "connections": (0., 0),
+              "timers": (0., 0),
+              "latency": (0.50, 0.001)}
+
+
+class Plant(object):
+    r"""
+
+        The tags checked by the TCS mashina over one cycle of the soak test.
+
+        Parameters
+        ----------
+        period \: float
+            seconds of one cycle
+        rows \: int
+            the number of samples returned as history
+    """
+
+    tags = ("TICA-101", "TICA-102", "P-101", "FICA-131.PV")
+
+    def __init__(self, period=120., rows=16):
+        self.period = period
+        self.rows = rows
+        self._samples_ = []
+
+    def sample(self, t):
+        r"""Returns the values of the tags at virtual time t.
+
+        The first quarter the storage sits between the charge and discharge
+        limits and TICA-102 keeps rising. Then the storage is briefly hot
+        enough to charge and cools down below the goal of the preheat.
+        Halfway TICA-102 becomes stable, which starts the preheat, and in the
+        third quarter the flow drops below its limit before the preheat ends.
+        The last quarter everything is back to normal.
+        """
+        phase = (t % self.period) / self.period
+        return {"TICA-101": 55. if 0.25 <= phase < 0.3 else 30. if 0.3 <= phase < 0.75 else 35.,
+                "TICA-102": 20. + 10. * min(t % self.period, self.period / 2),
+                "P-101": 100. if 0.65 <= phase < 0.75 else 300.,
+                "FICA-131.PV": 300.}
+
+    def source(self, clock):
+        r"""Returns the acquisition source reading the plant at the virtual time."""
+        import pandas as pd
+
+        def read():
+            self._samples_.append((clock.time(), self.sample(clock.time())))
+            del self._samples_[:-self.rows]
+            return pd.DataFrame([s for _, s in self._samples_], index=[t for t, _ in self._samples_])
+        return read
+
+
+def rss():
+    r"""Returns the resident memory in bytes."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # peak instead of current, but still grows with a leak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(clock):
+    r"""Collects the resource metrics of the process."""
+    from tools.general import runtime
+
+    gc.collect()
+    objects = gc.get_objects()
+    connections = sum(o.receivers for o in objects if isinstance(o, runtime.BoundSignal))
+    timers = sum(o.isActive() for o in objects if isinstance(o, runtime.Timer))
+    latency = statistics.median(clock.latencies) if clock.latencies else 0.
+    clock.latencies.clear()
+    return {"rss": rss(),
+            "traced": tracemalloc.get_traced_memory()[0],
+            "objects": len(objects),
+            "connections": connections,
+            "timers": timers,
+            "latency": latency}
+
+
+def growing(series, tolerance):
+    r"""Whether a metric grew from the first to the last third of the cycles.
+
+    Parameters
+    ----------
+    series \: list of float
+    tolerance \: tuple of float
+        the relative and absolute growth tolerated
+
+    Returns
+    -------
+    bool
+    """
+    third = max(1, len(series) // 3)
+    first, last = statistics.median(series[:third]), statistics.median(series[-third:])
+    relative, absolute = tolerance
+    return last - first > max(relative * abs(first), absolute)
+
+
+def run(cycles=200, warmup=20, period=120., config=CONFIG, topologyPath="topology.json"):
+    r"""Runs the soak test.
+
+    Returns
+    -------
+    dict
+        the metrics by name, one value per cycle after the warm-up
+    """
+    from tools.general import runtime
+    from tools.general.acquisition import Acquisition
+    from tools.general.history import HistoryStore
+    from tools.tcs.mashina import TCSMashina
+    from tools.tcs_statemashina import statemashina, topology
+
+    clock = runtime.VirtualScheduler()
+    runtime.setScheduler(clock)
+    plant = Plant(period)
+
+    # a short retention fills the history during the warm-up, so that only a leak keeps growing
+    history = HistoryStore(retention=(60, 30, 2))
+    acquisition = Acquisition(source=plant.source(clock), interval=1000, history=history)
+    tcs = TCSMashina(acquisition)
+    charges, preheats, errors = [], [], []
+    tcs.charge.connect(lambda: charges.append(clock.time()))
+    tcs.error.connect(lambda: errors.append(clock.time()))
+    stateMashina = statemashina.TCSStateMashina(tcs, config, 60000)
+    limit = stateMashina.constants["Charging"]["AD"]["Phase 1B"]["limit"]
+    tcs.stableADTemp.connect(lambda arg: preheats.append(clock.time()) if arg["StableTemp"] <= limit else None)
+    topology.build(stateMashina, topology.load(topologyPath, stateMashina.constants, topology.signalNames(tcs)))
+    acquisition.start()
+    stateMashina.start()
+
+    tracemalloc.start()
+    metrics = {iName: [] for iName in TOLERANCES}
+    for iCycle in range(cycles):
+        clock.advance(period)
+        if iCycle >= warmup:
+            for iName, iValue in measure(clock).items():
+                metrics[iName].append(iValue)
+        if iCycle % 10 == 0:
+            logger.info(f"Cycle {iCycle}: {len(charges)} charges, {len(preheats)} preheats, {len(errors)} errors, "
+                        f"{metrics['objects'][-1:]} objects.")
+    tracemalloc.stop()
+
+    stateMashina.stop_timers()
+    acquisition.stop()
+    for iName, iEvents in (("charges", charges), ("preheats", preheats), ("errors", errors)):
+        if len(iEvents) < cycles // 2:
+            raise RuntimeError(f"Only {len(iEvents)} {iName} in {cycles} cycles, the plant does not drive the cycle.")
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak test of the TCS control system.")
+    parser.add_argument("--cycles", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20, help="cycles before measuring")
+    parser.add_argument("--period", type=float, default=120., help="virtual seconds per cycle")
+    parser.add_argument("--config", default=CONFIG)
+    parser.add_argument("--topology", default="topology.json")
+    args = parser.parse_args(argv)
+    if args.cycles - args.warmup < 6:
+        parser.error("Measure at least 6 cycles after the warm-up.")
+
+    # the virtual clock is part of the headless runtime
+    os.environ["CCO_BACKEND"] = "asyncio"
+    metrics = run(args.cycles, args.warmup, args.period, args.config, args.topology)
+
+    failed = []
+    print(f"{'metric':>12} {'first':>14} {'last':>14}")
+    for iName, iSeries in metrics.items():
+        print(f"{iName:>12} {iSeries[0]:>14.6g} {iSeries[-1]:>14.6g}")
+        if growing(iSeries, TOLERANCES[iName]):
+            failed.append(iName)
+    if failed:
+        print(f"FAILED: {', '.join(failed)} kept growing.")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
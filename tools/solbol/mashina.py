@@ -1,10 +1,11 @@
 import sys
 
-from PyQt5.QtCore import (QObject, QTimer, pyqtSignal, pyqtSlot)
-from PyQt5.QtWidgets import (QApplication)
+from tools.general.backend import (QObject, QTimer, pyqtSignal)
+from tools.general.backend import (QApplication)
 
 from tools.general.checker import GeneralChecker as Checker
 from tools.general.checker import CheckerMaster
+from tools.general.conditions import All
 
 import logging
 
@@ -25,9 +26,9 @@ class SolBolMashina(QObject):
     solarPump = pyqtSignal()
     solarTemp = pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, acquisition=None):
         super().__init__()
-        self.checkers = CheckerMaster()
+        self.checkers = CheckerMaster(acquisition)
         self.logger = logging.getLogger(__name__)
         self.logger.info("Creating SolBol Mashina")
         self._active_ = False
@@ -35,16 +36,18 @@ class SolBolMashina(QObject):
     def activate(self):
         self.checkers.addChecker(Checker(func=lambda x: x["FI-532.PV"],
                                         settings={"lowlimit": 500},
-                                        name="SolarFlowChecker"
+                                        name="SolarFlowChecker",
+                                        acquisition=self.checkers.acquisition
                                         ))
-        self.checkers["SolarFlowChecker"].inLimit.connect(self._checkStart_)
-        self.checkers["SolarFlowChecker"].outLimit.connect(self._checkStop_)
-
         self.checkers.addChecker(Checker(func=lambda x: x["TICA-101"],
                                          settings={"highlimit": 20},
-                                         name="TemperatureDifferenceChecker"))
-        self.checkers["TemperatureDifferenceChecker"].inLimit.connect(self._checkStart_)
-        self.checkers["TemperatureDifferenceChecker"].outLimit.connect(self._checkStop_)
+                                         name="TemperatureDifferenceChecker",
+                                         acquisition=self.checkers.acquisition))
+        self.checkers.addCondition("Boiler", All("SolarFlowChecker", "TemperatureDifferenceChecker"))
+        self.checkers["Boiler"].inLimit.connect(self.start)
+        self.checkers["Boiler"].outLimit.connect(self.stop)
+        # the condition starts out not met, without emitting
+        self.stop()
         self._active_ = True
 
     @property
@@ -52,26 +55,11 @@ class SolBolMashina(QObject):
         return self._active_
 
     def deactivate(self):
+        self.checkers.removeCondition("Boiler")
         self.checkers.stop()
         self.stop()
         self._active_ = False
 
-    @pyqtSlot()
-    def _checkStart_(self):
-        self.logger.info(f"{self.sender().objectName()} is in limit.")
-        self.checkers.changeStatus(self.sender().objectName(), True)
-        if all(self.checkers.statusCheckers.values()):
-            self.start()
-        else:
-            self.stop()
-
-    @pyqtSlot()
-    def _checkStop_(self):
-        self.logger.info(f"{self.sender().objectName()} is out of limit.")
-        self.checkers.changeStatus(self.sender().objectName(), False)
-        if not(all(self.checkers.statusCheckers.values())):
-            self.stop()
-
     def start(self):
         self.logger.info("Turn XV-001 toward the Boiler.")
         self.logger.info("Turning P-011 ON.")
@@ -1,7 +1,9 @@
-from PyQt5.QtCore import (QObject, QTimer, pyqtSignal)
+from tools.general.backend import (QObject, QTimer, pyqtSignal)
 
 from tools.general.checker import GeneralChecker as Checker
 from tools.general.checker import CheckerMaster
+from tools.general import conditions
+from tools.general import trace
 
 import logging
 
@@ -29,9 +31,15 @@ class TCSMashina(QObject):
     temperatureReached = pyqtSignal()
     powerReached = pyqtSignal()
 
-    def __init__(self):
+    # The conditions ending the phases, by default the goal checker of the phase. A phase can declare
+    # its own with "exit" in its parameters, e.g. {"for": 30, "of": "StableADTemp"} (see conditions.parse).
+    exits = {"stableADTemp": "StableADTemp",
+             "temperatureReached": "SufficientT",
+             "powerReached": "SufficientP"}
+
+    def __init__(self, acquisition=None):
         super().__init__()
-        self.checkers = CheckerMaster()
+        self.checkers = CheckerMaster(acquisition)
         self.logger = logging.getLogger(__name__)
         self.logger.info("Creating TCS Mashina")
         QTimer.singleShot(500, self.ready.emit)
@@ -46,24 +54,49 @@ class TCSMashina(QObject):
 
     def neutral(self):
         # Turn off all the equipment related to TCS?
-        self.checkers.addChecker(Checker(func=lambda x: x["TICA-101"],
-                                         settings={"lowlimit": 50},
-                                         name="Charge"))
+        # Both limits are on the same temperature, so it is processed only once
+        self.checkers.addBand("TICA-101", func=lambda x: x["TICA-101"],
+                              settings={"lowlimit": 50},
+                              name="Charge")
         self.checkers["Charge"].inLimit.connect(self._charge_)
-        self.checkers.addChecker(Checker(func=lambda x: x["TICA-101"],
-                                         settings={"highlimit": 20},
-                                         name="Discharge"))
+        self.checkers.addBand("TICA-101", func=lambda x: x["TICA-101"],
+                              settings={"highlimit": 20},
+                              name="Discharge")
         self.checkers["Discharge"].inLimit.connect(self._discharge_)
 
     def _charge_(self):
-        self.checkers.stop()
+        self._endPhase_()
         self.charge.emit()
 
     def _discharge_(self):
-        self.checkers.stop()
+        self._endPhase_()
         self.discharge.emit()
 
-    def getStableADTemp(self, Tlimit, Flimit):
+    def _exit_(self, name, description, slot):
+        r"""Declares the condition ending the current phase.
+
+        Parameters
+        ----------
+        name \: str
+            one of exits
+        description \: str or dict
+            see conditions.parse, defaults to exits[name]
+        slot \: function
+            called once the condition is met
+        """
+        condition = conditions.parse(description or TCSMashina.exits[name])
+        if isinstance(condition, str):
+            condition = conditions.All(condition)
+        self.checkers.addCondition(name, condition)
+        self.checkers[name].inLimit.connect(slot)
+
+    def _endPhase_(self):
+        r"""Removes the exit conditions and stops the checkers of the current phase."""
+        for iName in self.checkers.conditions:
+            self.checkers.removeCondition(iName)
+        self.checkers.stop()
+
+    def getStableADTemp(self, Tlimit, Flimit, exit=None):
         self.logger.info("Opening valve XV-104.")
         self.logger.info("Opening valve XV-105.")
         self.logger.info("Setting MV-101 to manual mode with a CV of 0%.")
@@ -72,14 +105,16 @@ class TCSMashina(QObject):
         self.logger.info(f"Checking if flow does not go below {Flimit['lowlimit']} m3/h.")
         self.checkers.addChecker(Checker(func=lambda x: x["P-101"],
                                          settings=Flimit,
-                                         name="SufficientF"))
+                                         name="SufficientF",
+                                         acquisition=self.checkers.acquisition))
         self.checkers["SufficientF"].outLimit.connect(self._error_)
         # Goal checker
         self.logger.info(f"Waiting until change of temperature reaches {Tlimit['highlimit']} degC/s.")
         self.checkers.addChecker(Checker(func=lambda x: x["TICA-102"],
                                          settings=Tlimit,
-                                         name="StableADTemp"))
-        self.checkers["StableADTemp"].inLimit.connect(self._stableT_)
+                                         name="StableADTemp",
+                                         acquisition=self.checkers.acquisition))
+        self._exit_("stableADTemp", exit, self._stableT_)
 
     def _stableT_(self):
         self.logger.info("Stable temperature reached.")
@@ -87,60 +122,63 @@ class TCSMashina(QObject):
         # self._data_["TICA-101"].iloc[-100:].mean()
         T = 52
         self.logger.debug(f"Stable temperature: {T}")
-        self.checkers.stop("StableADTemp")
-        self.checkers.stop("SufficientF")
+        self._endPhase_()
         self.stableADTemp.emit({"StableTemp": T, "i": 5})
 
-    def heatConstPowerTo(self, deltaT, Tlimit, Flimit, flow=300):
+    def heatConstPowerTo(self, deltaT, Tlimit, Flimit, flow=300, exit=None):
         self.logger.info(f"Setting MV-101 to automatic mode with a delta setpoint of {deltaT} degC.")
         self.logger.info(f"Setting pump P-111 to automatic mode with a setpoint of {flow} m3/h.")
         # Flow checker
         self.logger.info(f"Checking if flow does not go below {Flimit['lowlimit']} m3/h.")
         self.checkers.addChecker(Checker(func=lambda x: x["P-101"],
                                          settings=Flimit,
-                                         name="SufficientF"))
+                                         name="SufficientF",
+                                         acquisition=self.checkers.acquisition))
         self.checkers["SufficientF"].outLimit.connect(self._error_)
         # Goal checker
-        self.logger.info(f"Waiting until temperature reaches {Tlimit['lowlimit']} degC.")
+        # the goal is either limit, depending on the phase
+        self.logger.info(f"Waiting until temperature is within {Tlimit.get('lowlimit', -float('inf'))} and "
+                         f"{Tlimit.get('highlimit', float('inf'))}.")
         self.checkers.addChecker(Checker(func=lambda x: x["TICA-101"],
                                          settings=Tlimit,
-                                         name="SufficientT"))
-        self.checkers["SufficientT"].inLimit.connect(self._reachedT_)
+                                         name="SufficientT",
+                                         acquisition=self.checkers.acquisition))
+        self._exit_("temperatureReached", exit, self._reachedT_)
 
-    def heatConstTempTo(self, T, Tlimit, Flimit, Plimit, flow=300):
+    def heatConstTempTo(self, T, Tlimit, Flimit, Plimit, flow=300, exit=None):
         self.logger.info(f"Setting MV-101 to automatic mode with a setpoint of {T} degC.")
         self.logger.info(f"Setting pump P-111 to automatic mode with a setpoint of {flow} m3/h.")
         # Flow checker
         self.checkers.addChecker(Checker(func=lambda x: x["P-101"],
                                          settings=Flimit,
-                                         name="SufficientF"))
+                                         name="SufficientF",
+                                         acquisition=self.checkers.acquisition))
         self.checkers["SufficientF"].outLimit.connect(self._error_)
         # Temperature into mixing valve checker
         self.checkers.addChecker(Checker(func=lambda x: T - x["TICA-101"],
                                          settings=Tlimit,
-                                         name="SufficientTin"))
+                                         name="SufficientTin",
+                                         acquisition=self.checkers.acquisition))
         self.checkers["SufficientTin"].outLimit.connect(self._error_)
         # Goal checker
         myFunc = lambda x: 4.2 * x["FICA-131.PV"] * (x["TICA-101"] - x["TICA-102"]) / 3.6
         self.checkers.addChecker(Checker(func=myFunc,
                                          settings=Plimit,
-                                         name="SufficientP"))
-        self.checkers["SufficientP"].inLimit.connect(self._reachedP_)
+                                         name="SufficientP",
+                                         acquisition=self.checkers.acquisition))
+        self._exit_("powerReached", exit, self._reachedP_)
 
     def storageValve(self, state):
         self.logger.info("Opening storage valve XV-601.")
 
     def _reachedT_(self):
         self.logger.info("Temperature limit reached.")
-        self.checkers.stop("SufficientT")
-        self.checkers.stop("SufficientF")
+        self._endPhase_()
         self.temperatureReached.emit()
 
-    def _reacherP_(self):
+    def _reachedP_(self):
         self.logger.info("Power limit reached.")
-        self.checkers.stop("SufficientF")
-        self.checkers.stop("SufficientTin")
-        self.checkers.stop("SufficientP")
+        self._endPhase_()
         self.powerReached.emit()
 
     def _signal_(self, checkers, signals, message=None):
@@ -156,5 +194,10 @@ class TCSMashina(QObject):
             iSignal.emit()
 
     def _error_(self):
-        self.checkers.stop()
+        try:
+            trace.error(f"{self.sender().objectName()} out of limit" if self.sender() else "")
+        except Exception as E:
+            # the trace must never keep the mashina from handling the error
+            self.logger.error(f"Trace not written: {E}")
+        self._endPhase_()
         self.error.emit()
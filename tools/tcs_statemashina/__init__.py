@@ -1,5 +1,11 @@
-import tools.tcs_statemashina.other
-import tools.tcs_statemashina.statemashina
-import tools.tcs_statemashina.neutral
-import tools.tcs_statemashina.charging
-import tools.tcs_statemashina.discharging
\ No newline at end of file
+import importlib
+
+# The submodules import the event loop backend (PyQt5), so they are only
+# imported when used, e.g. tools.tcs_statemashina.statemashina
+__all__ = ["other", "statemashina", "neutral", "charging", "discharging", "topology"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,4 @@
-from PyQt5.QtCore import (QState, pyqtSignal)
+from tools.general.backend import (QState, pyqtSignal)
 import logging
 logger = logging.getLogger(__name__)
 
@@ -19,8 +19,10 @@ class Phase_1A(QState):
     def onEntry(self, event):
         logger.info("Charging AD Phase 1A")
         state_machine = self.machine()
-        state_machine.tcs.getStableADTemp(Tlimit=state_machine.constants["Charging"]["AD"]["Phase 1A"]["TICA-102"],
-                                          Flimit=state_machine.constants["Charging"]["AD"]["Phase 1A"]["FICA-111"])
+        parameters = state_machine.parameters[self.objectName()]
+        state_machine.tcs.getStableADTemp(Tlimit=parameters["TICA-102"],
+                                          Flimit=parameters["FICA-111"],
+                                          exit=parameters.get("exit"))
 
 
 class Phase_1B(QState):
@@ -37,17 +39,26 @@ class Phase_1B(QState):
     def onEntry(self, event):
         logger.info("Charging AD Phase 1B")
         state_machine = self.machine()
+        parameters = state_machine.parameters[self.objectName()]
         arg = event.arguments()[0]
-        if arg["StableTemp"] > state_machine.constants["Charging"]["AD"]["Phase 1B"]["limit"]:
+        if arg["StableTemp"] > parameters["limit"]:
             logger.info("Stable temperature is higher than limit, skipping preheat of Charging_AD_Phase_1B.")
             self.warmup.emit()
         else:
             logger.info("Stable temperature is lower than limit, preheating needed.")
-            state_machine.tcs.heatConstPowerTo(deltaT=state_machine.constants["Charging"]["AD"]["Phase 1B"]["deltaT"],
-                                               flow=state_machine.constants["Charging"]["AD"]["Phase 1B"]["flow"],
-                                               Tlimit=state_machine.constants["Charging"]["AD"]["Phase 1B"]["TICA-101"],
-                                               Flimit=state_machine.constants["Charging"]["AD"]["Phase 1B"]["FICA-111"])
-            state_machine.tcs.temperatureReached.connect(self.warmup.emit)
+            state_machine.tcs.heatConstPowerTo(deltaT=parameters["deltaT"],
+                                               flow=parameters["flow"],
+                                               Tlimit=parameters["TICA-101"],
+                                               Flimit=parameters["FICA-111"],
+                                               exit=parameters.get("exit"))
+            state_machine.tcs.temperatureReached.connect(self.warmup)
+
+    def onExit(self, event):
+        try:
+            self.machine().tcs.temperatureReached.disconnect(self.warmup)
+        except TypeError:
+            # not connected when the preheat was skipped
+            pass
 
 
 class Phase_2(QState):
@@ -59,10 +70,12 @@ class Phase_2(QState):
     def onEntry(self, event):
         logger.info("Charging AD Phase 2")
         state_machine = self.machine()
-        state_machine.tcs.heatConstPowerTo(deltaT=state_machine.constants["Charging"]["AD"]["Phase 1B"]["deltaT"],
-                                           flow=state_machine.constants["Charging"]["AD"]["Phase 1B"]["flow"],
-                                           Tlimit=state_machine.constants["Charging"]["AD"]["Phase 1B"]["TICA-101"],
-                                           Flimit=state_machine.constants["Charging"]["AD"]["Phase 1B"]["FICA-111"])
+        parameters = state_machine.parameters[self.objectName()]
+        state_machine.tcs.heatConstPowerTo(deltaT=parameters["deltaT"],
+                                           flow=parameters["flow"],
+                                           Tlimit=parameters["TICA-101"],
+                                           Flimit=parameters["FICA-111"],
+                                           exit=parameters.get("exit"))
 
 
 class Phase_3(QState):
@@ -86,10 +99,12 @@ class Phase_3A(QState):
     def onEntry(self, event):
         logger.info("Charging AD Phase 3A")
         state_machine = self.machine()
-        state_machine.tcs.heatConstPowerTo(deltaT=state_machine.constants["Charging"]["AD"]["Phase 3A"]["deltaT"],
-                                           flow=state_machine.constants["Charging"]["AD"]["Phase 3A"]["flow"],
-                                           Tlimit=state_machine.constants["Charging"]["AD"]["Phase 3A"]["TICA-101"],
-                                           Flimit=state_machine.constants["Charging"]["AD"]["Phase 3A"]["FICA-111"])
+        parameters = state_machine.parameters[self.objectName()]
+        state_machine.tcs.heatConstPowerTo(deltaT=parameters["deltaT"],
+                                           flow=parameters["flow"],
+                                           Tlimit=parameters["TICA-101"],
+                                           Flimit=parameters["FICA-111"],
+                                           exit=parameters.get("exit"))
 
 
 class Phase_3B(QState):
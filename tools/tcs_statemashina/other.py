@@ -1,4 +1,4 @@
-from PyQt5.QtCore import QState
+from tools.general.backend import QState
 import logging
 logger = logging.getLogger(__name__)
 
@@ -1,7 +1,9 @@
-from PyQt5.QtCore import QStateMachine, QTimer
+from tools.general.backend import QStateMachine, QTimer
 
 import json
 
+from tools.tcs_statemashina import topology
+
 import logging
 # logger = logging.getLogger(__name__)
 # logger.setLevel(logging.DEBUG)
@@ -9,15 +11,18 @@ import logging
 
 class TCSStateMashina(QStateMachine):
 
-    def __init__(self, tcsmashina, constpath, interval=15000):
+    def __init__(self, tcsmashina, constpath, interval=15000, section=None):
         super(TCSStateMashina, self).__init__()
         self.logger = logging.getLogger(__name__)
         self.logger.info("Creating TCS State Mashina")
         self.logger.debug(f"Configuration: {constpath} checked at every {interval} ms.")
         self.tcs = tcsmashina
         self._constPath_ = constpath
+        self._section_ = section
         self._timerInterval = interval
         self.constants = None
+        self.parameters = {}
+        self._bindings_ = {}
         self._load_constants_()
         self._setup_timer_()
 
@@ -33,10 +38,33 @@ class TCSStateMashina(QStateMachine):
         self.logger.info("Getting new configuration.")
         try:
             with open(self._constPath_, mode="r") as file:
-                self.constants = json.load(file)
+                constants = json.load(file)
+                # several units can share one configuration file, each with its own section
+                self.constants = constants[self._section_] if self._section_ else constants
                 self.logger.debug(f"Configuration: {self.constants}")
         except Exception as E:
             self.logger.critical(f"Latest configuration not loaded!: {E}")
+        self._resolve_parameters_()
+
+    def bindParameters(self, bindings):
+        r"""Sets which part of the configuration belongs to which state.
+
+        Parameters
+        ----------
+        bindings \: dict
+            state name and the path to its parameters in the configuration
+        """
+        self._bindings_ = dict(bindings)
+        self._resolve_parameters_()
+
+    def _resolve_parameters_(self):
+        parameters = {}
+        for iState, iPath in self._bindings_.items():
+            try:
+                parameters[iState] = topology.resolve(self.constants, iPath)
+            except (KeyError, TypeError):
+                self.logger.debug(f"Parameters of {iState} missing in the configuration.")
+        self.parameters = parameters
 
     def stop_timers(self):
         self.tcs.checkers.stop()
@@ -0,0 +1,299 @@
+r"""
+Declarative topology of the TCS state machine.
+
+The states, their hierarchy, the transitions between them and the part of the
+configuration (config.json) each state uses are described in a JSON file, e.g.:
+
+    {"initial": "StartingPoint",
+     "states": {
+        "StartingPoint": {"class": "other.StartingPoint"},
+        "Neutral": {"class": "neutral.Neutral", "parameters": "Neutral"},
+        "Charging": {"parallel": true},
+        "Charging AD": {"class": "charging.ad.Main", "parent": "Charging",
+                        "initial": "Charging AD Phase 1A"},
+        "Charging AD Phase 1A": {"class": "charging.ad.Phase_1A", "parent": "Charging AD",
+                                 "parameters": "Charging/AD/Phase 1A"}},
+     "transitions": [
+        {"source": "StartingPoint", "signal": "tcs.ready", "target": "Neutral"},
+        {"source": "Neutral", "signal": "tcs.charge", "target": "Charging"}]}
+
+The classes are relative to tools.tcs_statemashina (QState when omitted). A
+signal is either one of the TCS mashina ("tcs.<signal>") or of a state
+("<state>.<signal>").
+
+The description is validated and compiled once at startup into a flat table
+of states (parents first) and transitions. The parameters of every state are
+resolved by the state machine whenever the configuration is (re)loaded, so
+that entering a state is a single lookup in TCSStateMashina.parameters.
+"""
+
+import importlib
+import json
+from functools import partial
+
+from tools.general import trace
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StateSpec(object):
+    r"""
+
+        The compiled description of one state.
+
+        Parameters
+        ----------
+        name \: str
+        cls \: str
+            the class relative to tools.tcs_statemashina or None for QState
+        parent \: str
+            the name of the parent state or None for top level states
+        parallel \: bool
+            whether the children are parallel states
+        initial \: str
+            the name of the initial child state
+        parameters \: tuple of str
+            the path to the parameters of the state in the configuration
+    """
+
+    def __init__(self, name, cls=None, parent=None, parallel=False, initial=None, parameters=None):
+        self.name = name
+        self.cls = cls
+        self.parent = parent
+        self.parallel = parallel
+        self.initial = initial
+        self.parameters = tuple(parameters.split("/")) if parameters else None
+
+    def __repr__(self):
+        return f"StateSpec({self.name!r})"
+
+
+class Topology(object):
+    r"""
+
+        A validated and compiled state machine topology.
+
+        Parameters
+        ----------
+        states \: list of StateSpec
+            parents before their children
+        transitions \: list of tuple
+            (source, signal, target) with the signal as (owner, name)
+        initial \: str
+        warnings \: list of str
+            problems that do not prevent building the state machine, e.g.
+            parameters missing in the current configuration
+    """
+
+    def __init__(self, states, transitions, initial, warnings=()):
+        self.states = states
+        self.transitions = transitions
+        self.initial = initial
+        self.warnings = list(warnings)
+
+    @property
+    def parameters(self):
+        return {s.name: s.parameters for s in self.states if s.parameters}
+
+
+def resolve(constants, path):
+    r"""Looks up the parameters of a state in the configuration.
+
+    Parameters
+    ----------
+    constants \: dict
+    path \: tuple of str
+
+    Returns
+    -------
+    dict
+    """
+    for iKey in path:
+        constants = constants[iKey]
+    return constants
+
+
+def compileTopology(description, constants=None, signals=None):
+    r"""Validates a topology description and compiles it.
+
+    Parameters
+    ----------
+    description \: dict
+        see the module documentation
+    constants \: dict
+        the configuration, to check the parameters of the states
+    signals \: iterable of str
+        the signals of the TCS mashina, to check the transitions
+
+    Returns
+    -------
+    Topology
+
+    Raises
+    ------
+    ValueError
+        listing all problems found
+    """
+    errors, warnings = [], []
+    known = {"class", "parent", "parallel", "initial", "parameters"}
+
+    specs = {}
+    for iName, iState in description.get("states", {}).items():
+        unknown = set(iState) - known
+        if unknown:
+            errors.append(f"State {iName} has unknown keys {sorted(unknown)}.")
+        specs[iName] = StateSpec(iName, cls=iState.get("class"), parent=iState.get("parent"),
+                                 parallel=bool(iState.get("parallel", False)), initial=iState.get("initial"),
+                                 parameters=iState.get("parameters"))
+    if not specs:
+        errors.append("The topology has no states.")
+
+    children = {iName: [] for iName in specs}
+    for iSpec in specs.values():
+        if iSpec.parent is None:
+            continue
+        if iSpec.parent not in specs:
+            errors.append(f"State {iSpec.name} has an unknown parent {iSpec.parent}.")
+        else:
+            children[iSpec.parent].append(iSpec.name)
+
+    # order parents before children, which also finds cycles
+    ordered = []
+    frontier = [iName for iName, iSpec in specs.items() if iSpec.parent is None]
+    while frontier:
+        iName = frontier.pop(0)
+        ordered.append(specs[iName])
+        frontier.extend(children[iName])
+    if len(ordered) != len(specs) and not any("unknown parent" in e for e in errors):
+        errors.append(f"The parents of {sorted(set(specs) - {s.name for s in ordered})} form a cycle.")
+
+    for iSpec in specs.values():
+        if iSpec.parallel and iSpec.initial:
+            errors.append(f"Parallel state {iSpec.name} cannot have an initial state.")
+        elif children[iSpec.name] and not iSpec.parallel and iSpec.initial is None:
+            errors.append(f"State {iSpec.name} has children but no initial state.")
+        elif iSpec.initial is not None and iSpec.initial not in children[iSpec.name]:
+            errors.append(f"The initial state {iSpec.initial} of {iSpec.name} is not one of its children.")
+        if iSpec.parameters and constants is not None:
+            try:
+                resolve(constants, iSpec.parameters)
+            except (KeyError, TypeError):
+                warnings.append(f"The parameters {'/'.join(iSpec.parameters)} of {iSpec.name} are not in the "
+                                f"configuration.")
+
+    initial = description.get("initial")
+    if initial not in specs:
+        errors.append(f"The initial state {initial} is not defined.")
+    elif specs[initial].parent is not None:
+        errors.append(f"The initial state {initial} is not a top level state.")
+
+    transitions = []
+    for i, iTransition in enumerate(description.get("transitions", [])):
+        source, signal, target = (iTransition.get(k) for k in ("source", "signal", "target"))
+        for iRole, iName in (("source", source), ("target", target)):
+            if iName not in specs:
+                errors.append(f"Transition {i} has an unknown {iRole} {iName}.")
+        owner, _, name = (signal or "").rpartition(".")
+        if not owner or not name:
+            errors.append(f"Transition {i} has an invalid signal {signal}, expected <owner>.<signal>.")
+        elif owner != "tcs" and owner not in specs:
+            errors.append(f"Transition {i} has a signal of an unknown state {owner}.")
+        elif owner == "tcs" and signals is not None and name not in signals:
+            errors.append(f"Transition {i} has an unknown TCS signal {name}.")
+        transitions.append((source, (owner, name), target))
+
+    if errors:
+        raise ValueError("Invalid state machine topology:\n" + "\n".join(errors))
+    for iWarning in warnings:
+        logger.warning(iWarning)
+    return Topology(ordered, transitions, initial, warnings)
+
+
+def load(path, constants=None, signals=None):
+    r"""Reads, validates and compiles a topology file.
+
+    Parameters
+    ----------
+    path \: str
+    constants \: dict
+    signals \: iterable of str
+
+    Returns
+    -------
+    Topology
+    """
+    logger.info(f"Loading state machine topology {path}.")
+    with open(path, mode="r") as file:
+        return compileTopology(json.load(file), constants, signals)
+
+
+def signalNames(mashina):
+    r"""Returns the names of the signals of a mashina, to be passed to load.
+
+    Parameters
+    ----------
+    mashina \: QObject
+        e.g. the TCS mashina
+
+    Returns
+    -------
+    set of str
+    """
+    from tools.general.backend import pyqtSignal
+    cls = type(mashina)
+    return {iName for iName in dir(cls) if isinstance(getattr(cls, iName, None), pyqtSignal)}
+
+
+def _class_(name):
+    from tools.general.backend import QState
+    if name is None:
+        return QState
+    module, _, cls = name.rpartition(".")
+    package = "tools.tcs_statemashina" + (f".{module}" if module else "")
+    return getattr(importlib.import_module(package), cls)
+
+
+def _trace_(mark, name):
+    if trace.active:
+        mark(name)
+
+
+def build(state_machine, topology):
+    r"""Creates the states and transitions of a topology in a state machine.
+
+    Parameters
+    ----------
+    state_machine \: TCSStateMashina
+    topology \: Topology
+
+    Returns
+    -------
+    dict
+        the created states by name
+    """
+    from tools.general.backend import QState
+
+    states = {}
+    for iSpec in topology.states:
+        args = (QState.ParallelStates,) if iSpec.parallel else ()
+        if iSpec.parent is None:
+            state = _class_(iSpec.cls)(*args)
+            state_machine.addState(state)
+        else:
+            state = _class_(iSpec.cls)(*args, states[iSpec.parent])
+        state.setObjectName(iSpec.name)
+        state.entered.connect(partial(_trace_, trace.enter, iSpec.name))
+        state.exited.connect(partial(_trace_, trace.leave, iSpec.name))
+        states[iSpec.name] = state
+    for iSpec in topology.states:
+        if iSpec.initial:
+            states[iSpec.name].setInitialState(states[iSpec.initial])
+
+    for source, (owner, name), target in topology.transitions:
+        signal = getattr(state_machine.tcs if owner == "tcs" else states[owner], name)
+        states[source].addTransition(signal, states[target])
+
+    state_machine.bindParameters(topology.parameters)
+    state_machine.setInitialState(states[topology.initial])
+    return states
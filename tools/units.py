@@ -0,0 +1,214 @@
+r"""
+Runs several TCS and SolBol units in one process.
+
+All units share a single acquisition (one poll of the data per interval for
+all of them), its history store and the event loop, so adding a unit only
+adds the evaluation of its checkers. Every unit keeps its own mashina, state
+machine and configuration section.
+
+The units are described in a JSON file, e.g.:
+
+    {"acquisition": {"interval": 1000},
+     "units": [
+        {"name": "TCS-1", "type": "tcs", "config": "config.json", "topology": "topology.json"},
+        {"name": "TCS-2", "type": "tcs", "config": "units_config.json", "section": "TCS-2",
+         "topology": "topology.json"},
+        {"name": "SolBol-1", "type": "solbol"}]}
+
+When one core is saturated, the units can be sharded over several worker
+processes (--workers), each running its own acquisition for its units.
+
+The checkers of tags can also be evaluated in a pool of worker processes
+reading a history in shared memory (see tools.general.parallel), switched on
+by an evaluator section with the tags kept in the shared history:
+
+    {"acquisition": {"interval": 1000},
+     "evaluator": {"tags": ["TICA-101", "TICA-102"], "capacity": 4096, "workers": 4},
+     "units": [...]}
+
+Usage:
+    python -m tools.units units.json [--workers N] [--headless] [--duration S] [--serve PORT]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class UnitHost(object):
+    r"""
+
+        Hosts the mashinas (and state machines) of several units sharing one
+        acquisition.
+
+        Parameters
+        ----------
+        units \: list of dict
+            the description of every unit, see the module documentation
+        interval \: int or float
+            the miliseconds between each poll of the acquisition
+        source \: function
+            see Acquisition
+        evaluator \: dict
+            the settings of the evaluator shared by the units (see
+            parallel.fromSettings), the checkers are evaluated in the process
+            when None
+    """
+
+    def __init__(self, units, interval=1000, source=None, evaluator=None):
+        from tools.general.acquisition import Acquisition
+
+        self.acquisition = Acquisition(source=source, interval=interval)
+        self.evaluator = None
+        if evaluator is not None:
+            from tools.general import parallel
+
+            self.evaluator = parallel.fromSettings(evaluator)
+        self.units = {}
+        self.stateMashinas = {}
+        for iUnit in units:
+            self.addUnit(iUnit)
+
+    def addUnit(self, unit):
+        r"""Creates the mashina (and state machine) of a unit.
+
+        Parameters
+        ----------
+        unit \: dict
+            name, type ("tcs" or "solbol") and for TCS units config, section,
+            topology and interval (of reloading the configuration)
+        """
+        name = unit["name"]
+        if name in self.units:
+            raise NameError(f"Unit {name} is defined twice.")
+        logger.info(f"Adding unit {name}.")
+        if unit["type"] == "tcs":
+            from tools.tcs.mashina import TCSMashina
+            from tools.tcs_statemashina import statemashina, topology
+
+            mashina = TCSMashina(self.acquisition)
+            stateMashina = statemashina.TCSStateMashina(mashina, unit.get("config", "config.json"),
+                                                        unit.get("interval", 1000), section=unit.get("section"))
+            topology.build(stateMashina, topology.load(unit.get("topology", "topology.json"),
+                                                       stateMashina.constants, topology.signalNames(mashina)))
+            self.stateMashinas[name] = stateMashina
+        elif unit["type"] == "solbol":
+            from tools.solbol.mashina import SolBolMashina
+
+            mashina = SolBolMashina(self.acquisition)
+        else:
+            raise ValueError(f"Unit {name} has an unknown type {unit['type']}.")
+        mashina.setObjectName(name)
+        if self.evaluator is not None:
+            mashina.checkers.setEvaluator(self.evaluator)
+        self.units[name] = mashina
+
+    def start(self):
+        self.acquisition.start()
+        for iName, iMashina in self.units.items():
+            if iName in self.stateMashinas:
+                self.stateMashinas[iName].start()
+            else:
+                iMashina.activate()
+
+    def stop(self):
+        for iName, iMashina in self.units.items():
+            if iName in self.stateMashinas:
+                self.stateMashinas[iName].stop_timers()
+            elif iMashina.active:
+                iMashina.deactivate()
+        self.acquisition.stop()
+        if self.evaluator is not None:
+            self.evaluator.close()
+            self.evaluator.history.close()
+
+
+def shard(units, workers):
+    r"""Splits the units over a number of workers, round robin.
+
+    Returns
+    -------
+    list of list of dict
+    """
+    return [units[i::workers] for i in range(workers) if units[i::workers]]
+
+
+def run(units, interval=1000, duration=None, serve=None, evaluator=None):
+    r"""Runs a UnitHost until the application quits.
+
+    Parameters
+    ----------
+    units \: list of dict
+    interval \: int or float
+        the miliseconds between each poll of the acquisition
+    duration \: int or float
+        seconds after which to stop, runs forever when None
+    serve \: int
+        the port of the snapshot API of the units, not served when None
+    evaluator \: dict
+        see UnitHost
+    """
+    from tools.general.backend import QApplication, QTimer
+
+    app = QApplication(sys.argv)
+    host = UnitHost(units, interval, evaluator=evaluator)
+    host.start()
+    if serve is not None:
+        from tools.general.snapshot import SnapshotServer
+
+        snapshotServer = SnapshotServer(host.acquisition, port=serve)
+        for iName, iMashina in host.units.items():
+            snapshotServer.addUnit(iName, iMashina.checkers, host.stateMashinas.get(iName))
+        snapshotServer.start()
+    if duration:
+        timer = QTimer()
+        timer.timeout.connect(host.stop)
+        timer.timeout.connect(app.quit)
+        timer.start(int(duration * 1000))
+    app.exec_()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs several TCS and SolBol units in one process.")
+    parser.add_argument("path", help="the JSON file describing the units")
+    parser.add_argument("--workers", type=int, default=1, help="the number of processes to shard the units over")
+    parser.add_argument("--headless", action="store_true", help="run on the asyncio runtime instead of Qt")
+    parser.add_argument("--duration", type=float, default=None, help="seconds after which to stop")
+    parser.add_argument("--serve", type=int, default=None,
+                        help="serve the snapshot API at this port (and the following ones for further workers)")
+    args = parser.parse_args(argv)
+
+    if args.headless:
+        # inherited by the worker processes
+        os.environ["CCO_BACKEND"] = "asyncio"
+    with open(args.path, mode="r") as file:
+        description = json.load(file)
+    units = description["units"]
+    interval = description.get("acquisition", {}).get("interval", 1000)
+    evaluator = description.get("evaluator")
+
+    if args.workers <= 1:
+        run(units, interval, args.duration, args.serve, evaluator)
+        return
+
+    # spawn, as Qt does not survive being forked
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run, name=f"units-{i}",
+                                 args=(iUnits, interval, args.duration,
+                                       args.serve + i if args.serve is not None else None, evaluator))
+                 for i, iUnits in enumerate(shard(units, args.workers))]
+    for iProcess in processes:
+        logger.info(f"Starting worker {iProcess.name}.")
+        iProcess.start()
+    for iProcess in processes:
+        iProcess.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,285 @@
+r"""
+Validates the configuration, the state machine topology and the units offline.
+
+Nothing is started and no data is read: neither the event loop backend
+(PyQt5), NumPy nor pandas are imported, so a change can be checked in well
+under a second, in CI or on the controller. The signals and state classes
+referenced by the topology are looked up in the source of the package.
+
+Checked are:
+    - the settings of every checker in the configuration (see
+      tools.general.settings), i.e. every section without subsections, and
+      the exit conditions of the phases
+    - the topology (see tools.tcs_statemashina.topology), including the
+      parameters of every state in the configuration, the classes of the
+      states and the signals of the transitions
+    - the units (see tools.units), with the configuration section and the
+      topology of every TCS unit and the settings of the evaluator
+
+Usage:
+    python -m tools.validate [--config config.json] [--topology topology.json]
+    python -m tools.validate --units units.json [--strict]
+"""
+
+import argparse
+import ast
+import json
+import os
+import sys
+import time
+
+from tools.general import settings
+from tools.tcs_statemashina import topology
+
+import logging
+logger = logging.getLogger(__name__)
+
+PACKAGE = os.path.dirname(os.path.abspath(__file__))
+MASHINA = os.path.join(PACKAGE, "tcs", "mashina.py")
+STATES = os.path.dirname(os.path.abspath(topology.__file__))
+
+
+def _source_(module):
+    r"""Returns the file of a module relative to tools.tcs_statemashina."""
+    path = os.path.join(STATES, *module.split("."))
+    return path + ".py" if os.path.isfile(path + ".py") else os.path.join(path, "__init__.py")
+
+
+def classes(path):
+    r"""Reads the classes of a module and their signals from its source.
+
+    Parameters
+    ----------
+    path \: str
+
+    Returns
+    -------
+    dict
+        class name and the set of its signal names
+    """
+    with open(path, mode="r") as file:
+        tree = ast.parse(file.read(), path)
+    found = {}
+    for iNode in tree.body:
+        if not isinstance(iNode, ast.ClassDef):
+            continue
+        found[iNode.name] = {iTarget.id for iStatement in iNode.body if isinstance(iStatement, ast.Assign)
+                             and isinstance(iStatement.value, ast.Call)
+                             and getattr(iStatement.value.func, "id", None) == "pyqtSignal"
+                             for iTarget in iStatement.targets if isinstance(iTarget, ast.Name)}
+    return found
+
+
+def checkCondition(spec):
+    r"""Validates the description of a condition without building it.
+
+    Parameters
+    ----------
+    spec \: str or dict
+        see tools.general.conditions.parse
+
+    Returns
+    -------
+    list of str
+    """
+    if isinstance(spec, str):
+        return []
+    if isinstance(spec, dict):
+        if isinstance(spec.get("all", spec.get("any")), list):
+            return [e for iChild in spec.get("all", spec.get("any")) for e in checkCondition(iChild)]
+        if "atleast" in spec and isinstance(spec.get("of"), list):
+            if not isinstance(spec["atleast"], int) or not 0 < spec["atleast"] <= len(spec["of"]):
+                return [f"atleast should be between 1 and {len(spec['of'])}, not {spec['atleast']!r}."]
+            return [e for iChild in spec["of"] for e in checkCondition(iChild)]
+        if "for" in spec and "of" in spec:
+            if not settings._number_(spec["for"]) or spec["for"] < 0:
+                return [f"for should be a number of seconds, not {spec['for']!r}."]
+            return checkCondition(spec["of"])
+    return [f"Condition not understood: {spec}."]
+
+
+def checkConfig(constants, path=()):
+    r"""Validates the checker settings of a configuration.
+
+    Every section containing no further sections holds the settings of a
+    checker, the other values of a section are parameters of the state. The
+    exit of a phase is a condition (see TCSMashina.exits).
+
+    Parameters
+    ----------
+    constants \: dict
+    path \: tuple of str
+
+    Returns
+    -------
+    list of str
+    """
+    if not isinstance(constants, dict):
+        return [f"{'/'.join(path) or 'The configuration'} should be a dict."]
+    if path and not any(isinstance(v, dict) for v in constants.values()):
+        return [f"{'/'.join(path)}: {iError}" for iError in settings.check(constants)]
+    errors = []
+    for iKey, iValue in constants.items():
+        if iKey == "exit":
+            errors.extend(f"{'/'.join(path + (iKey,))}: {iError}" for iError in checkCondition(iValue))
+        elif isinstance(iValue, dict):
+            errors.extend(checkConfig(iValue, path + (iKey,)))
+    return errors
+
+
+def checkTopology(description, constants):
+    r"""Validates a topology against a configuration and the source of the states.
+
+    Returns
+    -------
+    errors \: list of str
+    warnings \: list of str
+    """
+    tcs = classes(MASHINA).get("TCSMashina", set())
+    try:
+        compiled = topology.compileTopology(description, constants, tcs)
+    except ValueError as E:
+        return str(E).splitlines()[1:], []
+
+    errors, signals = [], {}
+    for iSpec in compiled.states:
+        if iSpec.cls is None:
+            continue
+        module, _, cls = iSpec.cls.rpartition(".")
+        try:
+            found = classes(_source_(module))
+        except (OSError, SyntaxError) as E:
+            errors.append(f"The module of state {iSpec.name} ({iSpec.cls}) cannot be read: {E}")
+            continue
+        if cls not in found:
+            errors.append(f"State {iSpec.name} has an unknown class {iSpec.cls}.")
+        signals[iSpec.name] = found.get(cls, set())
+    for i, (_, (owner, name), _) in enumerate(compiled.transitions):
+        if owner != "tcs" and owner in signals and name not in signals[owner]:
+            errors.append(f"Transition {i} has an unknown signal {name} of state {owner}.")
+    return errors, compiled.warnings
+
+
+def checkEvaluator(evaluator):
+    r"""Validates the settings of the evaluator of a units file.
+
+    Returns
+    -------
+    list of str
+    """
+    if not isinstance(evaluator, dict):
+        return ["The evaluator should be a dict."]
+    errors = []
+    tags = evaluator.get("tags")
+    if not isinstance(tags, list) or not tags or not all(isinstance(iTag, str) for iTag in tags):
+        errors.append(f"The evaluator needs the tags of its history as a list of strings, not {tags!r}.")
+    for iKey in ("capacity", "workers"):
+        if evaluator.get(iKey) is not None and not settings._count_(evaluator[iKey], 1):
+            errors.append(f"The evaluator {iKey} should be a positive integer, not {evaluator[iKey]!r}.")
+    unknown = set(evaluator) - {"tags", "capacity", "workers"}
+    if unknown:
+        errors.append(f"Unknown evaluator settings {sorted(unknown)}.")
+    return errors
+
+
+def _read_(path):
+    with open(path, mode="r") as file:
+        return json.load(file)
+
+
+def validate(config="config.json", topologyPath="topology.json", section=None):
+    r"""Validates a configuration and a topology.
+
+    Parameters
+    ----------
+    config \: str
+        the path to the configuration
+    topologyPath \: str
+        the path to the topology, not validated when None
+    section \: str
+        the section of the configuration of the unit
+
+    Returns
+    -------
+    errors \: list of str
+    warnings \: list of str
+    """
+    try:
+        constants = _read_(config)
+        if section:
+            constants = constants[section]
+    except (OSError, ValueError) as E:
+        return [f"{config}: {E}"], []
+    except KeyError:
+        return [f"{config}: The section {section} is missing."], []
+    errors = [f"{config}: {iError}" for iError in checkConfig(constants)]
+    warnings = []
+    if topologyPath is not None:
+        try:
+            description = _read_(topologyPath)
+        except (OSError, ValueError) as E:
+            return errors + [f"{topologyPath}: {E}"], warnings
+        topologyErrors, topologyWarnings = checkTopology(description, constants)
+        errors += [f"{topologyPath}: {iError}" for iError in topologyErrors]
+        warnings += [f"{topologyPath}: {iWarning}" for iWarning in topologyWarnings]
+    return errors, warnings
+
+
+def validateUnits(path):
+    r"""Validates a units file and the configuration and topology of every unit.
+
+    Returns
+    -------
+    errors \: list of str
+    warnings \: list of str
+    """
+    try:
+        description = _read_(path)
+        units = description["units"]
+    except (OSError, ValueError, KeyError, TypeError) as E:
+        return [f"{path}: {E}"], []
+    errors, warnings, names = [], [], set()
+    if "evaluator" in description:
+        errors += [f"{path}: {iError}" for iError in checkEvaluator(description["evaluator"])]
+    for i, iUnit in enumerate(units):
+        name = iUnit.get("name")
+        if name is None or name in names:
+            errors.append(f"{path}: Unit {i} has {'no' if name is None else 'a duplicate'} name {name or ''}.")
+        names.add(name)
+        if iUnit.get("type") == "tcs":
+            unitErrors, unitWarnings = validate(iUnit.get("config", "config.json"),
+                                                iUnit.get("topology", "topology.json"), iUnit.get("section"))
+            errors += [f"{name}: {iError}" for iError in unitErrors]
+            warnings += [f"{name}: {iWarning}" for iWarning in unitWarnings]
+        elif iUnit.get("type") != "solbol":
+            errors.append(f"{path}: Unit {name} has an unknown type {iUnit.get('type')}.")
+    return errors, warnings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validates the configuration, topology and units offline.")
+    parser.add_argument("--config", default="config.json")
+    parser.add_argument("--topology", default="topology.json")
+    parser.add_argument("--units", default=None, help="validate the units file instead, with every unit")
+    parser.add_argument("--strict", action="store_true", help="fail on warnings too")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.units:
+        errors, warnings = validateUnits(args.units)
+    else:
+        errors, warnings = validate(args.config, args.topology)
+    for iWarning in warnings:
+        print(f"WARNING {iWarning}")
+    for iError in errors:
+        print(f"ERROR {iError}")
+    failed = bool(errors) or (args.strict and bool(warnings))
+    print(f"{'FAILED' if failed else 'OK'}: {len(errors)} errors, {len(warnings)} warnings "
+          f"in {1000 * (time.perf_counter() - start):.0f} ms.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # the warnings are printed, not logged
+    logging.basicConfig(level=logging.ERROR)
+    sys.exit(main())